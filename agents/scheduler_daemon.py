@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+from pathlib import Path
+
+# Add project root to sys.path
+sys.path.append(str(Path(__file__).parent.parent))  # /home/god/PiFitness
+
+from backend_functions.scheduler import run_scheduler, run_tick
+
+# Resident replacement for the hourly cron entry.
+#   python agents/scheduler_daemon.py              # long-running, ticks every SCHEDULER_TICK_S
+#   python agents/scheduler_daemon.py --once       # single pass, same as agent_hourly.py
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PiFitness task scheduler")
+    parser.add_argument("--once", action="store_true", help="run one pass and exit")
+    parser.add_argument("--tick", type=int, default=None, help="seconds between ticks")
+    parser.add_argument("--health-port", type=int, default=None, help="0 disables the health endpoint")
+    args = parser.parse_args()
+
+    if args.once:
+        result = run_tick()
+        sys.exit(0 if result is not None else 1)
+    run_scheduler(tick_s=args.tick, health_port=args.health_port)
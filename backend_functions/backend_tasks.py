@@ -1,32 +1,29 @@
-import subprocess
-from datetime import datetime
-from pathlib import Path
-
 from dotenv import load_dotenv
 
-from backend_functions.database_functions import qec, one_sql_result, con_cur, sql_to_dict, get_log_tables
+from backend_functions.database_functions import qec, one_sql_result, sql_to_dict
 from backend_functions.helper_functions import list_to_dict_by_key
 from backend_functions.logging_functions import log_app_event, elapsed_ms, start_timer
+from backend_functions.backup_manager import run_backup
+from backend_functions.maintenance_planner import run_maintenance_plan
+from backend_functions.partition_manager import maintain_log_partitions
 import os
 
 load_dotenv()
 
+PAYLOAD_HASH_RETENTION_DAYS = int(os.getenv("PAYLOAD_HASH_RETENTION_DAYS", 30))
+
 
 def nightly_maintenance(days_to_keep=365):
     # Truncates Log files
-    # Vacuums the database
-    # Optimizes weekly
-    # Reindexes and does a full vacuum monthly
+    # Vacuums / analyzes / reindexes only the tables whose stats call for it
 
     st = start_timer() # Track elapsed seconds
 
-    conn, cursor = con_cur()
-
     try:
-        conn.autocommit = True
         # 2. Delete old eventLog rows (>48h)
 
-        logging_tables = get_log_tables()
+        # Partitioned log tables drop whole expired partitions; the rest delete rows
+        logging_tables = maintain_log_partitions(days_to_keep)
 
         for log_table in logging_tables:
             del_sql = f"""
@@ -36,24 +33,22 @@ def nightly_maintenance(days_to_keep=365):
             interval = f"{days_to_keep} days"
             qec(del_sql, (interval,))
 
+        # Forget old payload hashes so unchanged data is eventually re-staged
+        hash_sql = """DELETE FROM staging.api_payload_hashes
+                    WHERE first_seen_utc < NOW() - INTERVAL %s;"""
+        qec(hash_sql, (f"{PAYLOAD_HASH_RETENTION_DAYS} days",))
+
         # Log stats before VACUUM
         tsql = "SELECT SUM(total_size_mb) from logging.vw_db_size"
         size_before = one_sql_result(tsql)
 
 
-        # 3. Vacuum
+        # 3. Targeted VACUUM / ANALYZE / REINDEX CONCURRENTLY of the tables that need it
         maint_start = start_timer()
-        cursor.execute("VACUUM;")
-        maintenance_type = 'daily'
-
-        if datetime.today().weekday() == 6:
-            cursor.execute("ANALYZE;")
-            maintenance_type = 'weekly'
-
-        if datetime.today().day == 1:
-            cursor.execute("REINDEX DATABASE personal_fitness;")
-            cursor.execute("VACUUM FULL;")
-            maintenance_type = 'monthly'
+        plan_summary = run_maintenance_plan()
+        maintenance_type = 'planned'
+        print(f"Maintenance plan: {len(plan_summary['executed'])} run, "
+              f"{len(plan_summary['skipped'])} over budget, {len(plan_summary['failed'])} failed")
 
         maint_elapsed_ms = elapsed_ms(maint_start)
         # # Performance Testing
@@ -88,16 +83,13 @@ def nightly_maintenance(days_to_keep=365):
     except Exception as e:
         log_app_event(cat="DB Maintenance", desc="Error during maintenance", err=e)
         print(f"Nightly Maintenance failure: {e}")
-        conn.close()
         return False
 
-    conn.close()
-
     return True
 
 
 def backup_database(keep=7):
-    # Creates a backup and keeps the most recent 7
+    # Creates a parallel directory-format backup and, once it verifies, keeps the most recent 7
 
     for var in ["PG_BACKUP_LOCATION", "PG_HOST", "PG_PORT", "PG_DB", "PG_USER", "PG_PASSWORD"]:
         if os.getenv(var) is None:
@@ -107,39 +99,4 @@ def backup_database(keep=7):
             else:
                 raise ValueError(f"Missing required environment variable: {var}")
 
-
-    backup_dir = Path(os.getenv("PG_BACKUP_LOCATION"))
-    host = os.getenv("PG_HOST")
-    port = os.getenv("PG_PORT")
-    dbname = os.getenv("PG_DB")
-    user = os.getenv("PG_USER")
-
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = os.path.join(backup_dir, f"{dbname}_{timestamp}.dump")
-
-    cmd = [
-        "pg_dump",
-        "-h", host,
-        "-p", str(port),
-        "-U", user,
-        "-d", dbname,
-        "-F", "c",
-        "-f", backup_file
-    ]
-
-    env = os.environ.copy()
-
-    env["PGPASSWORD"] = os.getenv("PG_PASSWORD")
-
-    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
-
-    if result.returncode != 0:
-        raise RuntimeError(f"Backup failed: {result.stderr}")
-
-    backups = sorted(Path(backup_dir).glob("*.dump"))
-    while len(backups) > keep:
-        old = backups.pop(0)
-        old.unlink()
-
-    return backup_file
\ No newline at end of file
+    return run_backup(keep=keep)
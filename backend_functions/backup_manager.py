@@ -0,0 +1,180 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from backend_functions.log_sink import log_row
+
+load_dotenv()
+
+# Directory-format backups: pg_dump -F d -j N writes one file per table in
+# parallel, compressed at BACKUP_COMPRESS_LEVEL. A backup only counts once
+# pg_restore --list can read it, and old backups are only removed after the new
+# one is verified. Optionally the backup is restored into a throwaway database on
+# a separate Postgres server (BACKUP_VERIFY_PG_*, never the production one) to
+# prove it is usable.
+#   python -m backend_functions.backup_manager --verify-restore [backup_path]
+
+BACKUP_JOBS = int(os.getenv("BACKUP_JOBS", 2))
+BACKUP_COMPRESS_LEVEL = int(os.getenv("BACKUP_COMPRESS_LEVEL", 6))
+BACKUP_SCHEMAS = [s.strip() for s in os.getenv("BACKUP_SCHEMAS", "").split(",") if s.strip()]
+BACKUP_EXCLUDE_SCHEMAS = [s.strip() for s in os.getenv("BACKUP_EXCLUDE_SCHEMAS", "").split(",") if s.strip()]
+# Schemas whose tables are dumped without rows (definitions only)
+BACKUP_EXCLUDE_DATA_SCHEMAS = [s.strip() for s in os.getenv("BACKUP_EXCLUDE_DATA_SCHEMAS", "staging").split(",")
+                               if s.strip()]
+BACKUP_VERIFY_RESTORE = os.getenv("BACKUP_VERIFY_RESTORE", "false").lower() == "true"
+
+LOG_COLUMNS = ("backup_path", "backup_format", "jobs", "compress_level", "duration_ms", "size_mb",
+               "verified", "restore_verified", "restore_ms", "error_text")
+
+
+def _pg_env(prefix="PG"):
+    env = os.environ.copy()
+    env["PGPASSWORD"] = os.getenv(f"{prefix}_PASSWORD") or ""
+    return env
+
+
+def _size_mb(path):
+    path = Path(path)
+    if path.is_file():
+        return round(path.stat().st_size / 1048576, 2)
+    return round(sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 1048576, 2)
+
+
+def dump_command(target, jobs=None, compress_level=None):
+    jobs = jobs or BACKUP_JOBS
+    compress_level = BACKUP_COMPRESS_LEVEL if compress_level is None else compress_level
+    cmd = [
+        "pg_dump",
+        "-h", os.getenv("PG_HOST"),
+        "-p", str(os.getenv("PG_PORT")),
+        "-U", os.getenv("PG_USER"),
+        "-d", os.getenv("PG_DB"),
+        "-F", "d",
+        "-j", str(jobs),
+        "-Z", str(compress_level),
+        "-f", str(target)
+    ]
+    for schema in BACKUP_SCHEMAS:
+        cmd += ["-n", schema]
+    for schema in BACKUP_EXCLUDE_SCHEMAS:
+        cmd += ["-N", schema]
+    for schema in BACKUP_EXCLUDE_DATA_SCHEMAS:
+        cmd += [f"--exclude-table-data={schema}.*"]
+    return cmd
+
+
+def verify_backup(path):
+    # A backup is valid when pg_restore can read its table of contents
+    result = subprocess.run(["pg_restore", "--list", str(path)], capture_output=True, text=True)
+    return result.returncode == 0 and "TABLE" in result.stdout
+
+
+def verify_restore(path, jobs=None):
+    # Restores into a throwaway database on the BACKUP_VERIFY_PG_* server, counts
+    # the restored tables, then drops the database. Returns (ok, elapsed_ms, detail).
+    # Refuses to run unless that server is configured explicitly and is not the
+    # production one (PG_HOST / PG_PORT): the check creates and drops databases.
+    host = os.getenv("BACKUP_VERIFY_PG_HOST")
+    port = os.getenv("BACKUP_VERIFY_PG_PORT")
+    user = os.getenv("BACKUP_VERIFY_PG_USER")
+    if not (host and port and user):
+        return False, None, "restore check refused: set BACKUP_VERIFY_PG_HOST, _PORT and _USER"
+    if (host, str(port)) == (os.getenv("PG_HOST"), str(os.getenv("PG_PORT"))):
+        return False, None, "restore check refused: BACKUP_VERIFY_PG_* points at the production server"
+    env = _pg_env("BACKUP_VERIFY_PG")
+    conn_args = ["-h", host, "-p", str(port), "-U", user]
+    scratch_db = f"restore_verify_{datetime.now():%Y%m%d_%H%M%S}"
+
+    t0 = time.perf_counter()
+    result = subprocess.run(["createdb", *conn_args, scratch_db], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        return False, None, f"createdb failed: {result.stderr.strip()}"
+    try:
+        result = subprocess.run(["pg_restore", *conn_args, "-d", scratch_db, "-j", str(jobs or BACKUP_JOBS),
+                                 "--no-owner", "--no-privileges", str(path)],
+                                capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            return False, int((time.perf_counter() - t0) * 1000), f"pg_restore failed: {result.stderr.strip()[-500:]}"
+        count = subprocess.run(["psql", *conn_args, "-d", scratch_db, "-Atc",
+                                "SELECT COUNT(*) FROM pg_tables "
+                                "WHERE schemaname NOT IN ('pg_catalog', 'information_schema')"],
+                               capture_output=True, text=True, env=env)
+        tables = int(count.stdout.strip() or 0) if count.returncode == 0 else 0
+        return tables > 0, int((time.perf_counter() - t0) * 1000), f"{tables} tables restored"
+    finally:
+        subprocess.run(["dropdb", *conn_args, "--if-exists", scratch_db], capture_output=True, text=True, env=env)
+
+
+def list_backups(backup_dir, dbname):
+    # Directory backups and legacy single-file dumps, newest first
+    backups = [p for p in Path(backup_dir).glob(f"{dbname}_*") if p.is_dir() or p.suffix == ".dump"]
+    return sorted(backups, key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+def apply_retention(backup_dir, dbname, keep, newest):
+    # Keeps the newest `keep` backups; only called once `newest` has been verified
+    removed = []
+    for old in list_backups(backup_dir, dbname)[keep:]:
+        if old == newest:
+            continue
+        if old.is_dir():
+            shutil.rmtree(old)
+        else:
+            old.unlink()
+        removed.append(old.name)
+    return removed
+
+
+def run_backup(keep=7, verify_restore_db=None):
+    backup_dir = Path(os.getenv("PG_BACKUP_LOCATION"))
+    dbname = os.getenv("PG_DB")
+    target = backup_dir / f"{dbname}_{datetime.now():%Y%m%d_%H%M%S}"
+    verify_restore_db = BACKUP_VERIFY_RESTORE if verify_restore_db is None else verify_restore_db
+
+    t0 = time.perf_counter()
+    result = subprocess.run(dump_command(target), capture_output=True, text=True, env=_pg_env())
+    duration_ms = int((time.perf_counter() - t0) * 1000)
+
+    if result.returncode != 0:
+        log_row("logging.backup_log", LOG_COLUMNS,
+                (str(target), "directory", BACKUP_JOBS, BACKUP_COMPRESS_LEVEL, duration_ms, None,
+                 False, None, None, result.stderr[-1000:]))
+        shutil.rmtree(target, ignore_errors=True)
+        raise RuntimeError(f"Backup failed: {result.stderr}")
+
+    verified = verify_backup(target)
+    restore_ok, restore_ms, detail = None, None, None
+    if verified and verify_restore_db:
+        restore_ok, restore_ms, detail = verify_restore(target)
+        print(f"Restore verification: {'ok' if restore_ok else 'FAILED'} ({detail})")
+
+    error = None
+    if not verified:
+        error = "pg_restore --list could not read the backup"
+    elif restore_ok is False:
+        error = detail
+    log_row("logging.backup_log", LOG_COLUMNS,
+            (str(target), "directory", BACKUP_JOBS, BACKUP_COMPRESS_LEVEL, duration_ms, _size_mb(target),
+             verified, restore_ok, restore_ms, error))
+
+    if not verified or restore_ok is False:
+        raise RuntimeError(f"Backup {target} could not be verified; older backups were kept")
+
+    removed = apply_retention(backup_dir, dbname, keep, target)
+    print(f"Backup {target.name}: {duration_ms / 1000:.1f}s, {_size_mb(target)}MB, removed {len(removed)} old")
+    return str(target)
+
+
+if __name__ == "__main__":
+    if "--verify-restore" in sys.argv:
+        paths = [a for a in sys.argv[1:] if not a.startswith("--")]
+        path = Path(paths[0]) if paths else list_backups(os.getenv("PG_BACKUP_LOCATION"), os.getenv("PG_DB"))[0]
+        ok, ms, detail = verify_restore(path)
+        print(f"{path}: {'ok' if ok else 'FAILED'} in {ms} ms ({detail})")
+        sys.exit(0 if ok else 1)
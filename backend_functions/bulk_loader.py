@@ -0,0 +1,140 @@
+import hashlib
+import io
+import json
+import os
+import time
+from itertools import chain, islice
+
+from psycopg2.extras import execute_values
+
+# Streams JSON payloads into staging.api_imports.
+# Large batches go through COPY FROM STDIN fed by a generator, so records are
+# serialized while they are sent; tiny batches use execute_values, where the
+# COPY setup round trip costs more than it saves.
+
+COPY_MIN_ROWS = int(os.getenv("COPY_MIN_ROWS", 50))
+COPY_READ_SIZE = 64 * 1024
+
+COPY_SQL = "COPY staging.api_imports (api_function_name, payload) FROM STDIN"
+INSERT_SQL = "INSERT INTO staging.api_imports (api_function_name, payload) VALUES %s"
+
+# Claims hashes atomically; only hashes not seen before come back
+CLAIM_HASHES_SQL = """INSERT INTO staging.api_payload_hashes (api_function_name, payload_hash)
+                        SELECT %s, UNNEST(%s::TEXT[])
+                        ON CONFLICT (api_function_name, payload_hash) DO NOTHING
+                        RETURNING payload_hash"""
+
+
+def _copy_escape(text):
+    # COPY text format: backslash is the escape character, tab/newline are delimiters
+    return (text.replace("\\", "\\\\")
+                .replace("\t", "\\t")
+                .replace("\n", "\\n")
+                .replace("\r", "\\r"))
+
+
+class _LineStream(io.RawIOBase):
+    # Read-only file object over a generator of bytes, as expected by copy_expert
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = b""
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = COPY_READ_SIZE
+        while len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.bytes_read += len(chunk)
+        return chunk
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def _copy_lines(records, function_name):
+    prefix = _copy_escape(function_name) + "\t"
+    for record in records:
+        yield (prefix + _copy_escape(json.dumps(record)) + "\n").encode("utf-8")
+
+
+def payload_hash(record):
+    # sha256 of the canonical JSON form (sorted keys, no whitespace)
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def drop_seen_payloads(cur, records, function_name):
+    # Removes payloads already loaded for this api_function_name (and repeats within
+    # the batch). The hash claims share the caller's transaction, so a failed load
+    # releases them again. Returns (new records, duplicates skipped).
+    by_hash = {}
+    for record in records:
+        by_hash.setdefault(payload_hash(record), record)
+    if not by_hash:
+        return [], len(records)
+
+    cur.execute(CLAIM_HASHES_SQL, (function_name, list(by_hash.keys())))
+    claimed = {row[0] for row in cur.fetchall()}
+    fresh = [record for h, record in by_hash.items() if h in claimed]
+    return fresh, len(records) - len(fresh)
+
+
+def load_json_records(cur, records, function_name, dedupe=False):
+    # Loads records on the caller's cursor without committing.
+    # Returns the row/byte counts, duplicates skipped and the method that was used.
+    duplicates = 0
+    if dedupe:
+        records, duplicates = drop_seen_payloads(cur, list(records), function_name)
+
+    records = iter(records)
+    head = list(islice(records, COPY_MIN_ROWS))
+
+    if len(head) < COPY_MIN_ROWS:
+        values = [(function_name, json.dumps(record)) for record in head]
+        if values:
+            execute_values(cur, INSERT_SQL, values, page_size=1000)
+        return {"rows": len(values),
+                "bytes": sum(len(v[1]) for v in values),
+                "duplicates": duplicates,
+                "method": "insert"}
+
+    rows = {"count": 0}
+
+    def counted():
+        for record in chain(head, records):
+            rows["count"] += 1
+            yield record
+
+    stream = _LineStream(_copy_lines(counted(), function_name))
+    cur.copy_expert(COPY_SQL, stream, size=COPY_READ_SIZE)
+    return {"rows": rows["count"],
+            "bytes": stream.bytes_read,
+            "duplicates": duplicates,
+            "method": "copy"}
+
+
+def load_rates(stats, elapsed_s):
+    # Adds rows/s and bytes/s to a load_json_records result
+    stats["ms"] = int(elapsed_s * 1000)
+    if elapsed_s > 0:
+        stats["rows_per_s"] = round(stats["rows"] / elapsed_s, 1)
+        stats["bytes_per_s"] = round(stats["bytes"] / elapsed_s, 1)
+    else:
+        stats["rows_per_s"] = None
+        stats["bytes_per_s"] = None
+    return stats
+
+
+def timed_load(cur, records, function_name, dedupe=False):
+    t0 = time.perf_counter()
+    stats = load_json_records(cur, records, function_name, dedupe)
+    return load_rates(stats, time.perf_counter() - t0)
@@ -0,0 +1,266 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Process-wide psycopg2 connection pool shared by every database helper.
+# Connections handed out by get_conn() are wrapped in PooledConnection, so the
+# existing conn.close() calls hand the connection back instead of closing the socket.
+
+POOL_MIN = int(os.getenv("PG_POOL_MIN", 1))
+POOL_MAX = int(os.getenv("PG_POOL_MAX", 8))
+POOL_TIMEOUT_S = float(os.getenv("PG_POOL_TIMEOUT_S", 30))  # max wait for a free connection
+POOL_IDLE_S = float(os.getenv("PG_POOL_IDLE_S", 300))  # idle connections above POOL_MIN are closed after this
+POOL_CHECK_S = float(os.getenv("PG_POOL_CHECK_S", 60))  # connections idle longer than this are pinged first
+
+_cond = threading.Condition()
+_idle = deque()  # (raw connection, monotonic time it was returned)
+_state = {"in_use": 0, "pid": os.getpid()}
+# Connections inherited across fork(). They are never closed in the child (that
+# would terminate the parent's session) and are kept referenced so psycopg2
+# doesn't close them on garbage collection either.
+_inherited = []
+_stats = {"created": 0,
+          "reused": 0,
+          "discarded": 0,
+          "reaped": 0,
+          "health_failures": 0,
+          "waits": 0,
+          "wait_ms_total": 0.0,
+          "wait_ms_max": 0.0,
+          "timeouts": 0}
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PooledConnection:
+    # Behaves like a psycopg2 connection; close() returns it to the pool.
+
+    def __init__(self, raw):
+        object.__setattr__(self, "_raw", raw)
+        object.__setattr__(self, "_released", False)
+        object.__setattr__(self, "_pid", os.getpid())
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # e.g. conn.autocommit = True
+        setattr(self._raw, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # same semantics as psycopg2: commit/rollback, but do not close
+        if exc_type is None:
+            self._raw.commit()
+        else:
+            self._raw.rollback()
+
+    @property
+    def closed(self):
+        return 1 if self._released else self._raw.closed
+
+    def close(self):
+        if self._released:
+            return
+        object.__setattr__(self, "_released", True)
+        if self._pid != os.getpid():
+            _inherited.append(self._raw)
+            return
+        release_conn(self._raw)
+
+    def discard(self):
+        # Drops a connection that is known to be broken
+        if self._released:
+            return
+        object.__setattr__(self, "_released", True)
+        if self._pid != os.getpid():
+            _inherited.append(self._raw)
+            return
+        release_conn(self._raw, discard=True)
+
+    def __del__(self):
+        # Safety net for callers that never close their connection
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _new_connection():
+    return psycopg2.connect(
+        host=os.getenv("PG_HOST"),
+        port=os.getenv("PG_PORT"),
+        dbname=os.getenv("PG_DB"),
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        sslmode=os.getenv("PGSSLMODE", "disable")
+    )
+
+
+def _close_quietly(raw):
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+def _is_healthy(raw, idle_s):
+    # Cheap check on every checkout, round trip only for long-idle connections
+    if raw.closed:
+        return False
+    if idle_s < POOL_CHECK_S:
+        return True
+    try:
+        cur = raw.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        raw.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def _reap_idle():
+    # Must be called with _cond held. Returns connections for the caller to close outside the lock.
+    now = time.monotonic()
+    expired = []
+    while len(_idle) > POOL_MIN and now - _idle[0][1] > POOL_IDLE_S:
+        expired.append(_idle.popleft()[0])
+    _stats["reaped"] += len(expired)
+    return expired
+
+
+def _record_wait(wait_ms):
+    _stats["waits"] += 1
+    _stats["wait_ms_total"] += wait_ms
+    _stats["wait_ms_max"] = max(_stats["wait_ms_max"], wait_ms)
+
+
+def get_pooled_conn(timeout=None):
+    # Checks a connection out of the pool, opening one if below POOL_MAX
+    timeout = POOL_TIMEOUT_S if timeout is None else timeout
+    t0 = time.monotonic()
+    waited = False
+
+    while True:
+        raw = None
+        idle_s = 0
+        with _cond:
+            expired = _reap_idle()
+            while not _idle and _state["in_use"] + len(_idle) >= POOL_MAX:
+                remaining = timeout - (time.monotonic() - t0)
+                if remaining <= 0:
+                    _stats["timeouts"] += 1
+                    raise PoolTimeoutError(f"No database connection available after {timeout}s "
+                                           f"(pool max {POOL_MAX})")
+                waited = True
+                _cond.wait(remaining)
+            if _idle:
+                # LIFO keeps the oldest connections at the left so they can be reaped
+                raw, returned_at = _idle.pop()
+                idle_s = time.monotonic() - returned_at
+            _state["in_use"] += 1
+            if waited:
+                _record_wait((time.monotonic() - t0) * 1000)
+                waited = False
+
+        for old in expired:
+            _close_quietly(old)
+
+        if raw is None:
+            try:
+                raw = _new_connection()
+            except Exception:
+                with _cond:
+                    _state["in_use"] -= 1
+                    _cond.notify()
+                raise
+            with _cond:
+                _stats["created"] += 1
+            return PooledConnection(raw)
+
+        if _is_healthy(raw, idle_s):
+            with _cond:
+                _stats["reused"] += 1
+            return PooledConnection(raw)
+
+        # Broken connection: drop it and try again
+        _close_quietly(raw)
+        with _cond:
+            _state["in_use"] -= 1
+            _stats["health_failures"] += 1
+            _cond.notify()
+
+
+def release_conn(raw, discard=False):
+    # Resets a connection to a clean state and returns it to the pool
+    if not discard:
+        try:
+            if raw.closed:
+                discard = True
+            else:
+                if raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    raw.rollback()
+                if raw.autocommit:
+                    raw.autocommit = False
+        except Exception:
+            discard = True
+
+    if discard:
+        _close_quietly(raw)
+
+    with _cond:
+        _state["in_use"] -= 1
+        if discard:
+            _stats["discarded"] += 1
+        else:
+            _idle.append((raw, time.monotonic()))
+        _cond.notify()
+
+
+def pool_stats():
+    # Snapshot of pool size and wait metrics
+    with _cond:
+        stats = dict(_stats)
+        stats["idle"] = len(_idle)
+        stats["in_use"] = _state["in_use"]
+    stats["min_size"] = POOL_MIN
+    stats["max_size"] = POOL_MAX
+    stats["wait_ms_avg"] = round(stats["wait_ms_total"] / stats["waits"], 1) if stats["waits"] else 0.0
+    return stats
+
+
+def close_pool():
+    # Closes every idle connection; checked-out connections are closed when returned
+    with _cond:
+        to_close = [raw for raw, _ in _idle]
+        _idle.clear()
+    for raw in to_close:
+        _close_quietly(raw)
+
+
+def _reset_after_fork():
+    # Runs in a forked child: start with an empty pool and a fresh lock (another
+    # thread may have held the parent's at fork time)
+    global _cond
+    _cond = threading.Condition()
+    _inherited.extend(raw for raw, _ in _idle)
+    _idle.clear()
+    _state["in_use"] = 0
+    _state["pid"] = os.getpid()
+
+
+atexit.register(close_pool)
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,4 +1,6 @@
 import json
+import threading
+import time
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
 import os
@@ -10,10 +12,18 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 load_dotenv()
 
+# The Fernet key is derived on first use and memoized per process (PBKDF2 at
+# 390k iterations is slow on a Pi). KEY_CACHE_PATH optionally persists the derived
+# key between processes; the entry is only trusted while the passphrase file's
+# mtime is unchanged and the cache file is private to this user.
 
-def load_key():
-    # Creates a unique encryption key to be used by the application
-    passphrase = Path(os.getenv("KEY_PATH")).read_text().strip()
+KEY_CACHE_PATH = os.getenv("KEY_CACHE_PATH")
+
+_key_lock = threading.Lock()
+_key_state = {"key": None, "stamp": None, "source": None, "ms": None}
+
+
+def derive_key(passphrase):
     salt = 'static'
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
@@ -24,15 +34,110 @@ def load_key():
     return base64.urlsafe_b64encode(kdf.derive(passphrase.encode()))
 
 
-def encrypt_dict(dict, key=load_key()):
+def _passphrase_stamp(key_path):
+    st = key_path.stat()
+    return [str(key_path.resolve()), st.st_mtime_ns]
+
+
+def _read_key_cache(stamp):
+    if not KEY_CACHE_PATH:
+        return None
+    cache_path = Path(KEY_CACHE_PATH)
+    try:
+        st = cache_path.stat()
+        # Refuse caches that other users could have read or written
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            print(f"Ignoring key cache {cache_path}: permissions must be 0600")
+            return None
+        cached = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if cached.get("stamp") != stamp:
+        return None
+    return cached.get("key", "").encode() or None
+
+
+def _write_key_cache(stamp, key):
+    if not KEY_CACHE_PATH:
+        return
+    cache_path = Path(KEY_CACHE_PATH)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    try:
+        cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"stamp": stamp, "key": key.decode()}, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write key cache {cache_path}: {e}")
+
+
+def load_key():
+    # Returns the application's encryption key, deriving it at most once per process
+    key_path = Path(os.getenv("KEY_PATH"))
+    stamp = _passphrase_stamp(key_path)
+    with _key_lock:
+        if _key_state["key"] is not None and _key_state["stamp"] == stamp:
+            return _key_state["key"]
+
+        t0 = time.perf_counter()
+        key = _read_key_cache(stamp)
+        source = "disk"
+        if key is None:
+            key = derive_key(key_path.read_text().strip())
+            source = "derived"
+            _write_key_cache(stamp, key)
+
+        _key_state.update(key=key, stamp=stamp, source=source,
+                          ms=int((time.perf_counter() - t0) * 1000))
+        return key
+
+
+def key_timing():
+    # How the current process obtained its key and what it cost
+    with _key_lock:
+        return {"source": _key_state["source"], "ms": _key_state["ms"]}
+
+
+def key_timing_report():
+    # Compares a fresh PBKDF2 derivation with the memoized and on-disk paths
+    key_path = Path(os.getenv("KEY_PATH"))
+    t0 = time.perf_counter()
+    derive_key(key_path.read_text().strip())
+    derive_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    cached = _read_key_cache(_passphrase_stamp(key_path))
+    disk_ms = (time.perf_counter() - t0) * 1000 if cached is not None else None
+
+    load_key()
+    t0 = time.perf_counter()
+    load_key()
+    memo_ms = (time.perf_counter() - t0) * 1000
+
+    report = {"derive_ms": round(derive_ms, 1),
+              "disk_cache_ms": round(disk_ms, 2) if disk_ms is not None else None,
+              "memoized_ms": round(memo_ms, 3),
+              "first_load": key_timing()}
+    print(f"PBKDF2 derive: {report['derive_ms']} ms | "
+          f"disk cache: {report['disk_cache_ms'] if disk_ms is not None else 'disabled/miss'} ms | "
+          f"memoized: {report['memoized_ms']} ms")
+    return report
+
+
+def encrypt_dict(dict, key=None):
     # Convert dict to JSON string, then encrypt
     json_data = json.dumps(dict)
-    return Fernet(key).encrypt(json_data.encode()).decode()
+    return Fernet(key or load_key()).encrypt(json_data.encode()).decode()
 
 
 
-def decrypt_dict(token, key=load_key()):
-    decoded_data = Fernet(key).decrypt(token.encode()).decode()
+def decrypt_dict(token, key=None):
+    decoded_data = Fernet(key or load_key()).decrypt(token.encode()).decode()
     # Convert back to dict
     return json.loads(decoded_data)
 
+
+if __name__ == "__main__":
+    key_timing_report()
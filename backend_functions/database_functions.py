@@ -2,13 +2,15 @@ import os
 from datetime import datetime
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
 import psycopg2
 import socket
 from psycopg2.extras import RealDictCursor, execute_values
 import time
 
 
+from backend_functions.connection_pool import get_pooled_conn
+from backend_functions.engine_registry import get_engine
+from backend_functions.log_sink import log_row
 from backend_functions.helper_functions import list_to_dict_by_key
 
 load_dotenv()
@@ -23,27 +25,15 @@ def elapsed_ms(start_time):
 
 
 def get_conn(alchemy=False):
-    # returns the raw psycopg2 connection unless pandas/alchemy is requested.
+    # returns a pooled psycopg2 connection unless pandas/alchemy is requested.
+    # conn.close() hands the connection back to the shared pool; the alchemy
+    # engine is process-wide and must not be disposed by callers.
 
     if alchemy:
-        host = os.getenv("PG_HOST")
-        port = os.getenv("PG_PORT")
-        dbname = os.getenv("PG_DB")
-        user = os.getenv("PG_USER")
-        password = os.getenv("PG_PASSWORD")
-        conn_str = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{dbname}"
-        engine = create_engine(conn_str)
-        return engine
+        # shared, lazily created engine -- never build one per query
+        return get_engine()
     else:
-        c = psycopg2.connect(
-            host=os.getenv("PG_HOST"),
-            port=os.getenv("PG_PORT"),
-            dbname=os.getenv("PG_DB"),
-            user=os.getenv("PG_USER"),
-            password=os.getenv("PG_PASSWORD"),
-            sslmode=os.getenv("PGSSLMODE", "disable")
-        )
-        return c
+        return get_pooled_conn()
 
 
 def con_cur():
@@ -56,6 +46,7 @@ def qec(t_sql=None, p=None, auto_commit=False):
     # takes in sql, connects, executes, commits, and closes
     if not t_sql:
         return None
+    conn = None
     try:
         conn, cur = con_cur()
         if auto_commit:
@@ -66,12 +57,14 @@ def qec(t_sql=None, p=None, auto_commit=False):
             cur.execute(t_sql, p)
         conn.commit()
         cur.close()
-        conn.close()
     except Exception as e:
         msg1=f"Query Execution failure: {e}"
         msg2=f"Failing SQL: {t_sql}"
         msg3=f"Failing Params: {p}"
         return [msg1, msg2, msg3]
+    finally:
+        if conn is not None:
+            conn.close()
 
     return None
 
@@ -81,10 +74,12 @@ def one_sql_result(sql=None):
     if not sql:
         return None
     conn, cursor = con_cur()
-    cursor.execute(sql)
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    try:
+        cursor.execute(sql)
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
     if row is None:
         return None
 
@@ -94,21 +89,25 @@ def one_sql_result(sql=None):
 
 def sql_to_dict(query_str):
     conn = get_conn()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute(query_str)
-    rows = cur.fetchall()  # list of dicts if using RealDictCursor
-    cur.close()
-    conn.close()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(query_str)
+        rows = cur.fetchall()  # list of dicts if using RealDictCursor
+        cur.close()
+    finally:
+        conn.close()
     return rows
 
 
 def sql_to_list(query_str):
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(query_str)
-    values = [row[0] for row in cur.fetchall()] # list of dicts if using RealDictCursor
-    cur.close()
-    conn.close()
+    try:
+        cur = conn.cursor()
+        cur.execute(query_str)
+        values = [row[0] for row in cur.fetchall()] # list of dicts if using RealDictCursor
+        cur.close()
+    finally:
+        conn.close()
     return values
 
 
@@ -125,9 +124,13 @@ def get_sproc_list(append_option=None):
         WHERE routine_type = 'PROCEDURE'
         ORDER BY routine_name"""
     conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute(sql)
-    sproc_list = [row[0] for row in cursor.fetchall()]
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        sproc_list = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    finally:
+        conn.close()
     if append_option:
         sproc_list.append(append_option)
     return sproc_list
@@ -142,7 +145,8 @@ def get_log_tables(as_list=False):
                     WHERE 
                         n.nspname = 'logging'
                         AND a.attname = 'event_time_utc'
-                        AND c.relkind = 'r'     -- only real tables
+                        AND c.relkind IN ('r', 'p')     -- real or partitioned tables
+                        AND NOT c.relispartition        -- not the partitions themselves
                     ORDER BY 
                         c.relname;"""
     if as_list:
@@ -162,9 +166,43 @@ def get_table_row_count(pg_schema, pg_table):
     return one_sql_result(q_sql)
 
 
+_watermark_indexes = set()
+
+
+def _index_valid(pg_schema, ix_name):
+    # True / False from pg_index.indisvalid, None when the index does not exist
+    sql = f"""SELECT i.indisvalid FROM pg_catalog.pg_index i
+              JOIN pg_catalog.pg_class c ON c.oid = i.indexrelid
+              JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+              WHERE n.nspname = '{pg_schema}' AND c.relname = '{ix_name}';"""
+    return one_sql_result(sql)
+
+
+def get_field_watermark(pg_schema, pg_table, pg_field):
+    # MAX() of a calendar column, served by a btree index (created once, concurrently).
+    # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+    # skipping, so an invalid one is dropped and rebuilt; only a valid one is memoized.
+    key = (pg_schema, pg_table, pg_field)
+    if key not in _watermark_indexes:
+        ix_name = f"ix_{pg_table}_{pg_field}_wm"[:63]
+        if _index_valid(pg_schema, ix_name) is False:
+            print(f"Watermark index {ix_name} is invalid, rebuilding")
+            qec(f"DROP INDEX CONCURRENTLY IF EXISTS {pg_schema}.{ix_name};", auto_commit=True)
+        ix_sql = f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS {ix_name}
+                    ON {pg_schema}.{pg_table} ({pg_field});"""
+        e = qec(ix_sql, auto_commit=True)
+        if e:
+            print(f"Watermark index not created: {e[0]}")
+        if _index_valid(pg_schema, ix_name):
+            _watermark_indexes.add(key)
+
+    q_sql = f"""SELECT MAX({pg_field}) FROM {pg_schema}.{pg_table};"""
+    return one_sql_result(q_sql)
+
+
 def performance_profiling(segment=None, code=None, time_ms=None):
-    sql = "INSERT INTO staging.temp_performance_profiling (segment, code, time_ms) VALUES (%s, %s, %s);"
+    columns = ("segment", "code", "time_ms")
     params=(segment, code, int(time_ms))
-    qec(sql, params)
+    log_row("staging.temp_performance_profiling", columns, params)
     # print(rf)
     return start_timer()
\ No newline at end of file
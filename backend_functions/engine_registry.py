@@ -0,0 +1,105 @@
+import atexit
+import os
+import threading
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL
+
+load_dotenv()
+
+# Process-wide registry of SQLAlchemy engines used by pandas.read_sql.
+# One engine (and one connection pool) per DSN/options combination, created lazily.
+
+ENGINE_POOL_SIZE = int(os.getenv("PG_ENGINE_POOL_SIZE", 3))
+ENGINE_MAX_OVERFLOW = int(os.getenv("PG_ENGINE_MAX_OVERFLOW", 2))
+ENGINE_POOL_RECYCLE_S = int(os.getenv("PG_ENGINE_POOL_RECYCLE_S", 1800))
+
+_lock = threading.Lock()
+_engines = {}
+_stats = {"engines_created": 0,
+          "engines_disposed": 0,
+          "connections_created": 0,
+          "checkouts": 0}
+
+
+def default_url():
+    return URL.create(
+        drivername="postgresql+psycopg2",
+        username=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        host=os.getenv("PG_HOST"),
+        port=os.getenv("PG_PORT"),
+        database=os.getenv("PG_DB"),
+        query={"sslmode": os.getenv("PGSSLMODE", "disable")}
+    )
+
+
+def _on_connect(dbapi_conn, conn_record):
+    with _lock:
+        _stats["connections_created"] += 1
+
+
+def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+    with _lock:
+        _stats["checkouts"] += 1
+
+
+def get_engine(url=None, **options):
+    # Returns the shared engine for this DSN/options, creating it on first use
+    if url is None:
+        url = default_url()
+    engine_options = {"pool_size": ENGINE_POOL_SIZE,
+                      "max_overflow": ENGINE_MAX_OVERFLOW,
+                      "pool_pre_ping": True,
+                      "pool_recycle": ENGINE_POOL_RECYCLE_S}
+    engine_options.update(options)
+
+    url_key = url.render_as_string(hide_password=False) if isinstance(url, URL) else str(url)
+    key = (url_key, tuple(sorted((k, repr(v)) for k, v in engine_options.items())))
+
+    with _lock:
+        engine = _engines.get(key)
+        if engine is not None:
+            return engine
+
+        engine = create_engine(url, **engine_options)
+        event.listen(engine, "connect", _on_connect)
+        event.listen(engine, "checkout", _on_checkout)
+        _engines[key] = engine
+        _stats["engines_created"] += 1
+    return engine
+
+
+def engine_stats():
+    # Counters plus the pool status of every live engine, so leaks are visible
+    with _lock:
+        stats = dict(_stats)
+        engines = list(_engines.values())
+    stats["engines_live"] = len(engines)
+    stats["pools"] = [{"url": engine.url.render_as_string(hide_password=True),
+                       "status": engine.pool.status()} for engine in engines]
+    return stats
+
+
+def dispose_engines():
+    # Closes every pooled connection and forgets the engines
+    with _lock:
+        engines = list(_engines.values())
+        _engines.clear()
+        _stats["engines_disposed"] += len(engines)
+    for engine in engines:
+        engine.dispose()
+
+
+def _reset_after_fork():
+    # Runs in a forked child: drop the inherited pooled connections without closing
+    # them (they still belong to the parent); the engines reconnect on next use
+    global _lock
+    _lock = threading.Lock()
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+atexit.register(dispose_engines)
+os.register_at_fork(after_in_child=_reset_after_fork)
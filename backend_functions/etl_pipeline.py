@@ -0,0 +1,181 @@
+import os
+import queue
+import threading
+import time
+
+from backend_functions.bulk_loader import timed_load, load_rates
+from backend_functions.database_functions import con_cur
+
+# Overlapped extract -> load.
+# The extract generator runs on a worker thread and hands pages (lists of records)
+# over a bounded queue; the calling thread flushes fixed-size chunks to
+# staging.api_imports while extraction continues. A full queue blocks the
+# extractor, so memory is bounded by queue size + one chunk.
+# A generator can also yield window_checkpoint(...) markers: everything buffered
+# is flushed and the checkpoint + task watermark are committed in the same
+# transaction, so a later failure never throws away completed windows. With
+# windowed=True chunk-size flushes are held back until the window's marker, so
+# each window (payloads + checkpoint) is exactly one transaction; memory is then
+# bounded by one window instead of one chunk.
+# If extraction fails midway, what was extracted is still loaded (see the tail
+# flush below) and failed_stage is 'extract'; callers run their transform on it.
+
+LOAD_CHUNK_ROWS = int(os.getenv("LOAD_CHUNK_ROWS", 500))
+PIPELINE_QUEUE_PAGES = int(os.getenv("PIPELINE_QUEUE_PAGES", 8))
+
+_DONE = object()
+_CHECKPOINT = object()
+
+CHECKPOINT_SQL = """INSERT INTO tasks.task_checkpoints (task_name, window_start, window_end, rows_loaded)
+                    VALUES (%s, %s::DATE, %s::DATE, %s)
+                    ON CONFLICT (task_name, window_start) DO UPDATE SET
+                        window_end = EXCLUDED.window_end,
+                        rows_loaded = EXCLUDED.rows_loaded,
+                        completed_utc = NOW();"""
+
+WATERMARK_SQL = """UPDATE tasks.task_config
+                    SET updated_through_date = %s::DATE
+                    WHERE task_name = %s
+                      AND (updated_through_date IS NULL OR updated_through_date < %s::DATE);"""
+
+
+def window_checkpoint(task_name, window_start, window_end):
+    # Marker yielded by an extract generator once a date window is complete
+    return (_CHECKPOINT, {"task_name": task_name,
+                          "window_start": window_start,
+                          "window_end": window_end})
+
+
+def is_checkpoint(page):
+    return isinstance(page, tuple) and len(page) == 2 and page[0] is _CHECKPOINT
+
+
+def as_records(raw_json):
+    # Normalizes a single API response into a list of records (None = unexpected type)
+    if isinstance(raw_json, dict):
+        return [raw_json]
+    if isinstance(raw_json, list):
+        return raw_json
+    if raw_json is None:
+        return []
+    return None
+
+
+def _put(q, item, stop):
+    # Blocking put that gives up once the consumer has stopped
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _flush(records, function_name, totals, checkpoint=None, dedupe=False):
+    t0 = time.perf_counter()
+    conn, cur = con_cur()
+    try:
+        stats = timed_load(cur, records, function_name, dedupe)
+        if checkpoint is not None:
+            rows = totals["window_rows"] + stats["rows"]
+            cur.execute(CHECKPOINT_SQL, (checkpoint["task_name"], checkpoint["window_start"],
+                                         checkpoint["window_end"], rows))
+            cur.execute(WATERMARK_SQL, (checkpoint["window_end"], checkpoint["task_name"],
+                                        checkpoint["window_end"]))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    totals["load_s"] += time.perf_counter() - t0
+    totals["rows"] += stats["rows"]
+    totals["bytes"] += stats["bytes"]
+    totals["duplicates"] += stats["duplicates"]
+    totals["chunks"] += 1
+    if checkpoint is None:
+        totals["window_rows"] += stats["rows"]
+    else:
+        totals["window_rows"] = 0
+        totals["checkpoints"] += 1
+
+
+def stream_extract_load(pages, function_name, chunk_rows=None, queue_pages=None, on_checkpoint=None,
+                        dedupe=False, windowed=False):
+    # Returns extract_ms / load_ms (measured per stage, they overlap), the combined
+    # load statistics, and failed_stage + error when a stage raised.
+    # on_checkpoint(checkpoint, totals) is called after each committed window.
+    chunk_rows = chunk_rows or LOAD_CHUNK_ROWS
+    queue_pages = queue_pages or PIPELINE_QUEUE_PAGES
+
+    q = queue.Queue(maxsize=queue_pages)
+    stop = threading.Event()
+    extract = {"ms": None, "error": None, "pages": 0}
+
+    def producer():
+        t0 = time.perf_counter()
+        try:
+            for page in pages:
+                if not is_checkpoint(page):
+                    extract["pages"] += 1
+                if not _put(q, page, stop):
+                    break
+        except Exception as e:
+            extract["error"] = e
+        finally:
+            extract["ms"] = int((time.perf_counter() - t0) * 1000)
+            _put(q, _DONE, stop)
+
+    worker = threading.Thread(target=producer, name=f"extract-{function_name}", daemon=True)
+    worker.start()
+
+    totals = {"rows": 0, "bytes": 0, "duplicates": 0, "chunks": 0, "load_s": 0.0,
+              "window_rows": 0, "checkpoints": 0}
+    buffer = []
+    load_error = None
+    try:
+        while True:
+            page = q.get()
+            if page is _DONE:
+                break
+            if is_checkpoint(page):
+                _flush(buffer, function_name, totals, checkpoint=page[1], dedupe=dedupe)
+                buffer = []
+                if on_checkpoint is not None:
+                    on_checkpoint(page[1], totals)
+                continue
+            buffer.extend(page)
+            while not windowed and len(buffer) >= chunk_rows:
+                _flush(buffer[:chunk_rows], function_name, totals, dedupe=dedupe)
+                buffer = buffer[chunk_rows:]
+        # The tail is flushed even after an extract failure: every complete page that
+        # arrived is loaded and the caller transforms it (run_task does), so staging
+        # never holds a committed half that nothing processes. In windowed mode the
+        # tail is an unfinished window; it is dropped and reloaded on resume.
+        if buffer and not (windowed and extract["error"] is not None):
+            _flush(buffer, function_name, totals, dedupe=dedupe)
+    except Exception as e:
+        load_error = e
+        stop.set()
+
+    worker.join()
+
+    load_stats = load_rates({"rows": totals["rows"],
+                             "bytes": totals["bytes"],
+                             "duplicates": totals["duplicates"],
+                             "method": f"{totals['chunks']} chunk(s)"},
+                            totals["load_s"])
+    result = {"extract_ms": extract["ms"],
+              "load_ms": int(totals["load_s"] * 1000),
+              "pages": extract["pages"],
+              "checkpoints": totals["checkpoints"],
+              "load_stats": load_stats,
+              "failed_stage": None,
+              "error": None}
+
+    if extract["error"] is not None:
+        result["failed_stage"] = "extract"
+        result["error"] = extract["error"]
+    elif load_error is not None:
+        result["failed_stage"] = "load"
+        result["error"] = load_error
+    return result
@@ -20,8 +20,9 @@ def list_to_dict_by_key(list_of_dicts, primary_key):
     return {dict(item)[primary_key]: dict(item) for item in list_of_dicts}
 
 
-def get_sync_dates(meta_sync_val=None, meta_sync_type=None, max_range_days=7):
+def get_sync_dates(meta_sync_val=None, meta_sync_type=None, max_range_days=7, limit=True):
     # returns either a list of dates or a list of date pairs.
+    # limit=False returns every window through today (used by backfills).
 
     is_range = meta_sync_type == 'Range'
 
@@ -59,6 +60,9 @@ def get_sync_dates(meta_sync_val=None, meta_sync_type=None, max_range_days=7):
             curr_start = curr_end + timedelta(days=1)
 
 
+    if not limit:
+        return dates
+
     if meta_sync_type=='Day':
         dates = dates[:21]
     else:
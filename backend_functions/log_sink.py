@@ -0,0 +1,183 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+# Imported directly (not via database_functions) because database_functions and
+# logging_functions both write through this module.
+from backend_functions.connection_pool import get_pooled_conn
+
+load_dotenv()
+
+# Background writer for log rows. Callers enqueue (table, columns, values) and
+# return immediately; a single thread batches rows per table into multi-row
+# INSERTs every LOG_SINK_BATCH_ROWS rows or LOG_SINK_FLUSH_MS, whichever comes
+# first. The queue is bounded; when it is full LOG_SINK_DROP_POLICY decides
+# between dropping the newest row, dropping the oldest row, or blocking.
+
+LOG_SINK_ENABLED = os.getenv("LOG_SINK_ENABLED", "true").lower() == "true"
+LOG_SINK_MAX_ROWS = int(os.getenv("LOG_SINK_MAX_ROWS", 5000))
+LOG_SINK_BATCH_ROWS = int(os.getenv("LOG_SINK_BATCH_ROWS", 200))
+LOG_SINK_FLUSH_MS = int(os.getenv("LOG_SINK_FLUSH_MS", 1000))
+LOG_SINK_DROP_POLICY = os.getenv("LOG_SINK_DROP_POLICY", "drop_newest")  # drop_newest | drop_oldest | block
+
+_lock = threading.Lock()
+_queue = queue.Queue(maxsize=LOG_SINK_MAX_ROWS)
+_writer = {"thread": None}
+_stats = {"enqueued": 0,
+          "written": 0,
+          "dropped": 0,
+          "failed": 0,
+          "batches": 0,
+          "max_depth": 0,
+          "last_batch_ms": None}
+
+
+def _insert_rows(table, columns, rows):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s"
+    conn = get_pooled_conn()
+    try:
+        cur = conn.cursor()
+        execute_values(cur, sql, rows, page_size=len(rows))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+
+def _write_batch(batch):
+    t0 = time.perf_counter()
+    groups = {}
+    for table, columns, values in batch:
+        groups.setdefault((table, columns), []).append(values)
+
+    written, failed = 0, 0
+    for (table, columns), rows in groups.items():
+        try:
+            _insert_rows(table, columns, rows)
+            written += len(rows)
+        except Exception as e:
+            # Retry one by one so a single bad row doesn't lose the whole batch
+            print(f"Log sink batch into {table} failed ({e}); retrying row by row")
+            for row in rows:
+                try:
+                    _insert_rows(table, columns, [row])
+                    written += 1
+                except Exception as row_error:
+                    failed += 1
+                    print(f"Log sink dropped a {table} row: {row_error}")
+
+    with _lock:
+        _stats["written"] += written
+        _stats["failed"] += failed
+        _stats["batches"] += 1
+        _stats["last_batch_ms"] = int((time.perf_counter() - t0) * 1000)
+
+
+def _writer_loop():
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + LOG_SINK_FLUSH_MS / 1000
+        while len(batch) < LOG_SINK_BATCH_ROWS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        except Exception as e:
+            with _lock:
+                _stats["failed"] += len(batch)
+            print(f"Log sink write failed: {e}")
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def _ensure_writer():
+    with _lock:
+        thread = _writer["thread"]
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_writer_loop, name="log-sink", daemon=True)
+            thread.start()
+            _writer["thread"] = thread
+
+
+def log_row(table, columns, values):
+    # Queues one row for table; written synchronously when the sink is disabled
+    columns = tuple(columns)
+    if not LOG_SINK_ENABLED:
+        try:
+            _insert_rows(table, columns, [tuple(values)])
+        except Exception as e:
+            print(f"Log write into {table} failed: {e}")
+        return
+
+    _ensure_writer()
+    item = (table, columns, tuple(values))
+    try:
+        if LOG_SINK_DROP_POLICY == "block":
+            _queue.put(item)
+        else:
+            _queue.put_nowait(item)
+    except queue.Full:
+        with _lock:
+            _stats["dropped"] += 1
+        if LOG_SINK_DROP_POLICY != "drop_oldest":
+            return
+        try:
+            _queue.get_nowait()
+            _queue.task_done()
+        except queue.Empty:
+            pass
+        try:
+            _queue.put_nowait(item)
+        except queue.Full:
+            return
+
+    with _lock:
+        _stats["enqueued"] += 1
+        _stats["max_depth"] = max(_stats["max_depth"], _queue.qsize())
+
+
+def flush(timeout=10):
+    # Blocks until every queued row has been written (or timeout seconds pass)
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            return False
+        if _writer["thread"] is None or not _writer["thread"].is_alive():
+            _ensure_writer()
+        time.sleep(0.01)
+    return True
+
+
+def sink_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats["queue_depth"] = _queue.qsize()
+    stats["capacity"] = LOG_SINK_MAX_ROWS
+    stats["policy"] = LOG_SINK_DROP_POLICY if LOG_SINK_ENABLED else "disabled"
+    return stats
+
+
+def _reset_after_fork():
+    # Runs in a forked child: rows queued by the parent stay the parent's to write,
+    # and the writer thread did not survive the fork
+    global _lock, _queue
+    _lock = threading.Lock()
+    _queue = queue.Queue(maxsize=LOG_SINK_MAX_ROWS)
+    _writer["thread"] = None
+    for key in _stats:
+        _stats[key] = None if key == "last_batch_ms" else 0
+
+
+atexit.register(flush)
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,6 +1,18 @@
+import atexit
+import os
+import threading
 import time
 
-from backend_functions.database_functions import qec
+from backend_functions.log_sink import log_row
+
+# High-frequency API events (token reuse) are counted in memory and written as one
+# logging.api_logins row per (service, event) with event_count every
+# API_EVENT_FLUSH_S, instead of one synchronous INSERT per call.
+API_EVENT_FLUSH_S = int(os.getenv("API_EVENT_FLUSH_S", 300))
+
+_api_event_lock = threading.Lock()
+_api_event_counts = {}
+_api_event_state = {"last_flush": time.monotonic()}
 
 
 def log_app_event(cat, desc, err=None, exec_time=None):
@@ -13,24 +25,55 @@ def log_app_event(cat, desc, err=None, exec_time=None):
         err = str(err)
         err = err.replace("'", "")
 
-    statement = (f"""INSERT INTO logging.application_events
-                (event_category, event_description, execution_time_ms, error_text)
-                VALUES (%s, %s, %s, %s);
-                         """)
+    columns = ("event_category", "event_description", "execution_time_ms", "error_text")
     params = (cat, desc, exec_time, err)
 
-    qec(statement, params)
+    log_row("logging.application_events", columns, params)
     return
 
-def log_api_event(service, event, token_age=None, err=None):
-    insert_sql = """INSERT INTO logging.api_logins  
-        (api_service_name, event_name, token_age_s, error_text) VALUES
-        (%s, %s, %s, %s); """
+def log_api_event(service, event, token_age=None, err=None, event_count=None):
+    columns = ("api_service_name", "event_name", "token_age_s", "error_text")
     params = (service, event, token_age, str(err))
-    qec(insert_sql, params)
+    if event_count is not None:
+        columns += ("event_count",)
+        params += (event_count,)
+    log_row("logging.api_logins", columns, params)
     return
 
 
+def count_api_event(service, event, token_age=None):
+    # Aggregated alternative to log_api_event for events that fire on every call
+    with _api_event_lock:
+        entry = _api_event_counts.setdefault((service, event), {"count": 0, "token_age_max": None})
+        entry["count"] += 1
+        if token_age is not None:
+            entry["token_age_max"] = max(token_age, entry["token_age_max"] or 0)
+        due = time.monotonic() - _api_event_state["last_flush"] >= API_EVENT_FLUSH_S
+    if due:
+        flush_api_events()
+
+
+def flush_api_events():
+    # Writes one row per aggregated (service, event); token_age_s is the largest age seen
+    with _api_event_lock:
+        pending = dict(_api_event_counts)
+        _api_event_counts.clear()
+        _api_event_state["last_flush"] = time.monotonic()
+    for (service, event), entry in pending.items():
+        log_api_event(service, event, token_age=entry["token_age_max"], event_count=entry["count"])
+
+
+def _reset_after_fork():
+    # Counts pending in the parent are flushed by the parent
+    global _api_event_lock
+    _api_event_lock = threading.Lock()
+    _api_event_counts.clear()
+
+
+atexit.register(flush_api_events)
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
 def start_timer():
     return time.perf_counter()
 
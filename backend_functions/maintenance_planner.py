@@ -0,0 +1,196 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+from backend_functions.database_functions import con_cur, sql_to_dict
+from backend_functions.log_sink import log_row
+
+load_dotenv()
+
+# Targeted nightly maintenance. Reads pg_stat_user_tables plus table/index sizes
+# (the same numbers logging.vw_db_size reports), plans per-table actions for the
+# tables (and partitioned parents) that cross a threshold, and runs them most-urgent first until the time
+# budget is spent. Nothing here takes an ACCESS EXCLUSIVE lock: plain VACUUM,
+# ANALYZE and REINDEX TABLE CONCURRENTLY only. Every action is logged to
+# logging.db_stats with its table_name.
+
+MAINT_TIME_BUDGET_S = int(os.getenv("MAINT_TIME_BUDGET_S", 600))
+MAINT_DEAD_RATIO = float(os.getenv("MAINT_DEAD_RATIO", 0.2))
+MAINT_MIN_DEAD_TUPLES = int(os.getenv("MAINT_MIN_DEAD_TUPLES", 1000))
+MAINT_ANALYZE_MOD_RATIO = float(os.getenv("MAINT_ANALYZE_MOD_RATIO", 0.1))
+MAINT_ANALYZE_MAX_AGE_DAYS = int(os.getenv("MAINT_ANALYZE_MAX_AGE_DAYS", 7))
+MAINT_INDEX_BLOAT_PCT = float(os.getenv("MAINT_INDEX_BLOAT_PCT", 0.3))  # share of btree pages
+MAINT_REINDEX_MIN_MB = float(os.getenv("MAINT_REINDEX_MIN_MB", 10))
+MAINT_REINDEX_MIN_DAYS = int(os.getenv("MAINT_REINDEX_MIN_DAYS", 30))
+
+# Estimated btree bloat per table, from the catalog only (no pgstattuple scan): each
+# index's expected size is its reltuples times the average entry width (pg_stats
+# column widths plus the tuple header and line pointer) packed at its fillfactor;
+# pages beyond that are bloat. Indexes without statistics get a 1kB column width and
+# so never look bloated.
+INDEX_BLOAT_SQL = """
+    SELECT idx.indrelid,
+           SUM(idx.relpages) * current_setting('block_size')::NUMERIC / 1048576.0 AS btree_size_mb,
+           SUM(GREATEST(idx.relpages - idx.est_pages, 0))
+               * current_setting('block_size')::NUMERIC / 1048576.0 AS bloat_mb
+    FROM (SELECT i.indrelid, ci.relpages,
+                 1 + CEIL(ci.reltuples
+                          * (12 + CEIL(SUM((1 - COALESCE(s.null_frac, 0)) * COALESCE(s.avg_width, 1024)) / 8) * 8)
+                          / ((current_setting('block_size')::NUMERIC - 24 - 16)
+                             * COALESCE(SUBSTRING(array_to_string(ci.reloptions, ' ')
+                                                  FROM 'fillfactor=([0-9]+)')::NUMERIC, 90) / 100)) AS est_pages
+          FROM pg_catalog.pg_index i
+          JOIN pg_catalog.pg_class ci ON ci.oid = i.indexrelid
+          JOIN pg_catalog.pg_class ct ON ct.oid = i.indrelid
+          JOIN pg_catalog.pg_namespace n ON n.oid = ct.relnamespace
+          JOIN pg_catalog.pg_am am ON am.oid = ci.relam AND am.amname = 'btree'
+          JOIN pg_catalog.pg_attribute a ON a.attrelid = i.indexrelid AND a.attnum > 0
+          -- Expression columns keep their statistics under the index's name
+          LEFT JOIN pg_catalog.pg_stats s
+                 ON s.schemaname = n.nspname AND s.attname = a.attname AND NOT s.inherited
+                AND s.tablename = CASE WHEN i.indkey[a.attnum - 1] = 0 THEN ci.relname ELSE ct.relname END
+          WHERE ci.relpages > 0 AND ci.reltuples > 0
+          GROUP BY i.indrelid, ci.oid, ci.relpages, ci.reltuples, ci.reloptions) idx
+    GROUP BY idx.indrelid
+"""
+
+TABLE_STATS_SQL = f"""
+    SELECT s.schemaname || '.' || s.relname AS table_name,
+           s.n_live_tup,
+           s.n_dead_tup,
+           s.n_mod_since_analyze,
+           EXTRACT(EPOCH FROM NOW() - GREATEST(s.last_analyze, s.last_autoanalyze)) / 86400 AS analyze_age_days,
+           pg_table_size(s.relid) / 1048576.0 AS table_size_mb,
+           pg_indexes_size(s.relid) / 1048576.0 AS index_size_mb,
+           b.btree_size_mb,
+           b.bloat_mb AS index_bloat_mb,
+           r.last_reindex_days
+    FROM pg_stat_user_tables s
+    JOIN pg_catalog.pg_class c ON c.oid = s.relid
+    LEFT JOIN ({INDEX_BLOAT_SQL}) b ON b.indrelid = s.relid
+    LEFT JOIN (SELECT table_name,
+                      EXTRACT(EPOCH FROM NOW() - MAX(event_time_utc)) / 86400 AS last_reindex_days
+               FROM logging.db_stats
+               WHERE maintenance_type = 'reindex'
+               GROUP BY table_name) r ON r.table_name = s.schemaname || '.' || s.relname
+    WHERE c.relkind <> 'p'   -- partition parents hold no rows; their partitions are listed
+"""
+
+# Autovacuum never analyzes a partitioned parent, so the planner statistics for
+# queries against the parent go stale. Churn is the sum over its partitions (reset
+# whenever a partition is analyzed, so it undercounts); the age check covers the rest.
+PARTITIONED_STATS_SQL = """
+    SELECT n.nspname || '.' || c.relname AS table_name,
+           SUM(s.n_live_tup) AS n_live_tup,
+           SUM(s.n_mod_since_analyze) AS n_mod_since_analyze,
+           EXTRACT(EPOCH FROM NOW() - pg_stat_get_last_analyze_time(c.oid)) / 86400 AS analyze_age_days
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_inherits i ON i.inhparent = c.oid
+    JOIN pg_stat_user_tables s ON s.relid = i.inhrelid
+    WHERE c.relkind = 'p'
+    GROUP BY n.nspname, c.relname, c.oid
+"""
+
+ACTION_SQL = {"vacuum": "VACUUM (ANALYZE) {table};",
+              "analyze": "ANALYZE {table};",
+              "reindex": "REINDEX TABLE CONCURRENTLY {table};"}
+
+
+def _needs_analyze(t):
+    live = t.get("n_live_tup") or 0
+    modified = t.get("n_mod_since_analyze") or 0
+    analyze_age = t.get("analyze_age_days")
+    stale = analyze_age is None or float(analyze_age) >= MAINT_ANALYZE_MAX_AGE_DAYS
+    churned = modified >= max(live, 1) * MAINT_ANALYZE_MOD_RATIO
+    return (stale and modified > 0) or (churned and modified >= MAINT_MIN_DEAD_TUPLES)
+
+
+def plan_maintenance(stats=None, parent_stats=None):
+    # Returns [(priority, action, table_name, reason)] ordered most urgent first
+    stats = stats if stats is not None else sql_to_dict(TABLE_STATS_SQL)
+    parent_stats = parent_stats if parent_stats is not None else sql_to_dict(PARTITIONED_STATS_SQL)
+    plan = []
+    for t in stats:
+        live = t.get("n_live_tup") or 0
+        dead = t.get("n_dead_tup") or 0
+        modified = t.get("n_mod_since_analyze") or 0
+        btree_mb = float(t.get("btree_size_mb") or 0)
+        bloat_mb = float(t.get("index_bloat_mb") or 0)
+        dead_ratio = dead / max(live + dead, 1)
+
+        vacuum = dead >= MAINT_MIN_DEAD_TUPLES and dead_ratio >= MAINT_DEAD_RATIO
+        if vacuum:
+            # VACUUM (ANALYZE) also covers stale statistics
+            plan.append((dead, "vacuum", t["table_name"], f"dead ratio {dead_ratio:.2f} ({dead} tuples)"))
+        elif _needs_analyze(t):
+            plan.append((modified / 10, "analyze", t["table_name"], f"{modified} rows modified since analyze"))
+
+        last_reindex = t.get("last_reindex_days")
+        recently_reindexed = last_reindex is not None and float(last_reindex) < MAINT_REINDEX_MIN_DAYS
+        if (bloat_mb >= MAINT_REINDEX_MIN_MB and btree_mb > 0 and bloat_mb / btree_mb >= MAINT_INDEX_BLOAT_PCT
+                and not recently_reindexed):
+            plan.append((bloat_mb * 1024, "reindex", t["table_name"],
+                         f"~{bloat_mb:.1f}MB of {btree_mb:.1f}MB btree index bloat"))
+
+    for t in parent_stats:
+        # Partition analyzes reset the summed churn, so a stale parent with rows is
+        # analyzed even when it reads 0. ANALYZE on a parent also re-samples each partition.
+        modified = t.get("n_mod_since_analyze") or 0
+        analyze_age = t.get("analyze_age_days")
+        stale = analyze_age is None or float(analyze_age) >= MAINT_ANALYZE_MAX_AGE_DAYS
+        if _needs_analyze(t) or (stale and (t.get("n_live_tup") or 0) > 0):
+            plan.append((modified / 10, "analyze", t["table_name"],
+                         f"partitioned, {modified} partition rows modified"))
+
+    plan.sort(key=lambda p: p[0], reverse=True)
+    return plan
+
+
+def _total_size_mb(cur, table):
+    cur.execute("SELECT pg_total_relation_size(%s::regclass) / 1048576.0;", (table,))
+    return float(cur.fetchone()[0])
+
+
+def _log_action(table, action, size_before, size_after, action_ms, total_ms):
+    log_row("logging.db_stats",
+            ("size_before_mb", "size_after_mb", "maintenance_time_ms", "total_time_ms",
+             "maintenance_type", "table_name"),
+            (size_before, size_after, action_ms, total_ms, action, table))
+
+
+def run_maintenance_plan(budget_s=None, plan=None):
+    # Executes the plan until the budget is spent; returns a summary of what ran
+    budget_s = MAINT_TIME_BUDGET_S if budget_s is None else budget_s
+    plan = plan if plan is not None else plan_maintenance()
+    t0 = time.perf_counter()
+    summary = {"planned": len(plan), "executed": [], "skipped": [], "failed": []}
+
+    conn, cur = con_cur()
+    try:
+        conn.autocommit = True   # VACUUM / REINDEX CONCURRENTLY can't run in a transaction
+        for _priority, action, table, reason in plan:
+            if time.perf_counter() - t0 >= budget_s:
+                summary["skipped"].append((action, table))
+                continue
+            print(f"Maintenance: {action} {table} ({reason})")
+            a0 = time.perf_counter()
+            try:
+                size_before = _total_size_mb(cur, table)
+                cur.execute(ACTION_SQL[action].format(table=table))
+                size_after = _total_size_mb(cur, table)
+            except Exception as e:
+                print(f"Maintenance {action} {table} failed: {e}")
+                summary["failed"].append((action, table, str(e)))
+                continue
+            action_ms = int((time.perf_counter() - a0) * 1000)
+            _log_action(table, action, size_before, size_after, action_ms,
+                        int((time.perf_counter() - t0) * 1000))
+            summary["executed"].append((action, table))
+        cur.close()
+    finally:
+        conn.close()
+
+    summary["elapsed_ms"] = int((time.perf_counter() - t0) * 1000)
+    return summary
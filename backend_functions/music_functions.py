@@ -1,11 +1,24 @@
-import pandas as pd
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-from backend_functions.database_functions import get_conn, sql_to_list, elapsed_ms, qec, sql_to_dict, one_sql_result
+from psycopg2.extras import execute_values
+
+from backend_functions.database_functions import sql_to_list, elapsed_ms, qec, sql_to_dict, one_sql_result, \
+    con_cur
+from backend_functions.etl_pipeline import stream_extract_load
 from backend_functions.logging_functions import log_app_event, start_timer
+from backend_functions.playlist_sync import sync_playlist
+from backend_functions.rate_limiter import rate_limited_call
 from backend_functions.service_logins import get_spotify_client
+from backend_functions.shuffle_engine import new_seed, shuffle_order, shuffle_weights
 from backend_functions.task_execution import json_loading, task_log
 import time
 
+# Playlists are fetched concurrently; requests still share the Spotify rate budget
+PLAYLIST_FETCH_WORKERS = int(os.getenv("PLAYLIST_FETCH_WORKERS", 4))
+PLAYLIST_PAGE_LIMIT = 100  # Spotify's maximum for playlist items
+AUTO_SHUFFLE_WORKERS = int(os.getenv("AUTO_SHUFFLE_WORKERS", 3))
+
 
 
 def get_playlist_list(list_type=None):
@@ -23,9 +36,11 @@ def get_playlist_list(list_type=None):
     return sql_to_list(sql)
 
 
-def playlist_to_db(client=None, list_id=None, list_type=None):
+def playlist_to_db(client=None, list_id=None, list_type=None, force=None):
     # Connects to Spotify API and downloads all tracks
     # Uploads JSON to DB, which is then processed via stored procedure.
+    # Playlists whose snapshot_id matches the last synced one are skipped, unless
+    # force is set (the default when a specific list_id is requested).
 
     # Monitor performance, start the timer
     t0 = start_timer()
@@ -54,55 +69,63 @@ def playlist_to_db(client=None, list_id=None, list_type=None):
     client = get_spotify_client(client)
     sp = client.get("client")
 
-    # Initialize Results
-    all_items=[]
-    e=None
-    # Iterate through list of playlists
-    for l in playlists:
-        if l != playlists[0]:
-            time.sleep(2)
-        try:
-            results = sp.playlist_items(playlist_id=l, additional_types=['track'])
-        except Exception as e:
-            log_app_event(cat='Playlist Fetch Failure', desc=f"ID: {l}", err=e)
-            continue
+    # Cheap header calls first: only playlists whose snapshot changed are downloaded
+    if force is None:
+        force = list_id is not None
+    header_t0 = start_timer()
+    snapshots = playlist_snapshots(sp, playlists)
+    if not force:
+        stored = stored_snapshots(playlists)
+        playlists = [p for p in playlists if snapshots.get(p) is None or snapshots[p] != stored.get(p)]
+    skipped = len(snapshots) - len(playlists) if not force else 0
+    header_ms = elapsed_ms(header_t0)
 
-        # Get the next page of results
-        while results:
-            all_items.append(results)
-            results = sp.next(results)
+    if not playlists:
+        log_app_event(cat='Playlist Sync', desc=f"{task_name}: fetched 0, skipped {skipped} (unchanged)",
+                      exec_time=header_ms)
+        task_log(task_name=task_name, e_time=header_ms, fail_type=None, fail_text=None)
+        return client
 
-    extract_ms = elapsed_ms(t0)
+    # Fetch playlists concurrently and load each one's pages as soon as it is complete
+    fetch = {"playlists": 0, "failures": 0, "error": None, "completed": []}
+    el = stream_extract_load(playlist_pages(sp, playlists, fetch), 'playlist_details')
+    extract_ms = el["extract_ms"] + header_ms
+    load_ms = el["load_ms"]
+    load_stats = el["load_stats"]
+    print(f"Fetched {fetch['playlists']} playlist(s), {el['pages']} page(s), {fetch['failures']} failure(s)")
+    log_app_event(cat='Playlist Sync',
+                  desc=f"{task_name}: fetched {fetch['playlists']}, skipped {skipped} (unchanged), "
+                       f"failed {fetch['failures']}",
+                  exec_time=extract_ms)
 
     # Stop if no results
-    if not all_items:
+    if el["failed_stage"] is None and not load_stats["rows"]:
         task_log(task_name=task_name,
                  e_time=extract_ms,
                  l_time=None,
                  t_time=None,
                  fail_type='No playlist items',
-                 fail_text=f"{len(playlists)} playlist(s) attempted: {e}")
+                 fail_text=f"{len(playlists)} playlist(s) attempted: {fetch['error']}")
         return client
 
-    # Load blob to postgres
-    t0 = start_timer()
-    try:
-        json_loading(all_items, 'playlist_details')
-        load_ms = elapsed_ms(t0)
-    except Exception as e:
+    if el["failed_stage"] is not None:
         task_log(task_name=task_name,
                  e_time=extract_ms,
-                 l_time=elapsed_ms(t0),
+                 l_time=load_ms,
                  t_time=None,
                  fail_type='No playlist items',
-                 fail_text=f"{len(playlists)} playlist(s) attempted: {e}")
+                 fail_text=f"{len(playlists)} playlist(s) attempted: {el['error']}",
+                 load_stats=load_stats)
         return client
 
     # Integrate Results
     t0 = start_timer()
     try:
         sql = f"CALL staging.flatten_playlist_details('{list_type}');"
-        qec(sql)
+        err = qec(sql)
+        if err:
+            # qec reports failures instead of raising; snapshots must not be saved
+            raise RuntimeError(err[0])
         transform_ms = elapsed_ms(t0)
 
     except Exception as e:
@@ -111,18 +134,115 @@ def playlist_to_db(client=None, list_id=None, list_type=None):
                  l_time=load_ms,
                  t_time=elapsed_ms(t0),
                  fail_type='No playlist items',
-                 fail_text=f"{len(playlists)} playlist(s) attempted: {e}")
+                 fail_text=f"{len(playlists)} playlist(s) attempted: {e}",
+                 load_stats=load_stats)
         return client
 
+    # Remember what was synced so the next run can skip unchanged playlists
+    save_snapshots({p: snapshots.get(p) for p in fetch["completed"] if snapshots.get(p)})
+
     task_log(task_name=task_name,
              e_time=extract_ms,
              l_time=load_ms,
              t_time=transform_ms,
              fail_type=None,
-             fail_text=None)
+             fail_text=None,
+             load_stats=load_stats)
     return client
 
 
+def playlist_snapshots(sp, playlists, workers=None):
+    # {playlist_id: snapshot_id} from lightweight header calls; failures map to None
+    def header(playlist_id):
+        try:
+            return rate_limited_call('Spotify', sp.playlist, playlist_id, fields='snapshot_id').get("snapshot_id")
+        except Exception as e:
+            log_app_event(cat='Playlist Fetch Failure', desc=f"ID: {playlist_id} snapshot", err=e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers or PLAYLIST_FETCH_WORKERS,
+                            thread_name_prefix="playlist-header") as pool:
+        return dict(zip(playlists, pool.map(header, playlists)))
+
+
+def stored_snapshots(playlists):
+    conn, cur = con_cur()
+    try:
+        cur.execute("""SELECT playlist_id, snapshot_id FROM music.playlist_config
+                       WHERE playlist_id = ANY(%s)""", (list(playlists),))
+        stored = {row[0]: row[1] for row in cur.fetchall()}
+        cur.close()
+    finally:
+        conn.close()
+    return stored
+
+
+def save_snapshots(snapshots):
+    if not snapshots:
+        return
+    conn, cur = con_cur()
+    try:
+        execute_values(cur, """UPDATE music.playlist_config pc SET snapshot_id = v.snapshot_id
+                              FROM (VALUES %s) AS v(playlist_id, snapshot_id)
+                              WHERE pc.playlist_id = v.playlist_id""", list(snapshots.items()))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+
+def _playlist_page(sp, playlist_id, offset):
+    return rate_limited_call('Spotify', sp.playlist_items, playlist_id=playlist_id, additional_types=['track'],
+                             limit=PLAYLIST_PAGE_LIMIT, offset=offset)
+
+
+def playlist_pages(sp, playlists, fetch, workers=None):
+    # Generator of one-record pages for stream_extract_load.
+    # The first page of every playlist is requested up front; its 'total' gives the
+    # remaining offsets, which are then fetched in parallel. A playlist's pages are
+    # only yielded once all of them arrived, so a failed page never leaves a
+    # partial playlist in staging for the flatten procedure to act on.
+    workers = workers or PLAYLIST_FETCH_WORKERS
+    pending = {}
+    collected = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="playlist-fetch") as pool:
+        for playlist_id in playlists:
+            pending[pool.submit(_playlist_page, sp, playlist_id, 0)] = (playlist_id, 0)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                playlist_id, offset = pending.pop(future)
+                entry = collected.get(playlist_id)
+                if entry is not None and entry["failed"]:
+                    continue
+                try:
+                    page = future.result()
+                except Exception as e:
+                    log_app_event(cat='Playlist Fetch Failure', desc=f"ID: {playlist_id} offset {offset}", err=e)
+                    fetch["failures"] += 1
+                    fetch["error"] = e
+                    collected[playlist_id] = {"failed": True}
+                    continue
+
+                if offset == 0:
+                    offsets = range(PLAYLIST_PAGE_LIMIT, page.get("total") or 0, PLAYLIST_PAGE_LIMIT)
+                    entry = {"failed": False, "pages": {0: page}, "expected": 1 + len(offsets)}
+                    collected[playlist_id] = entry
+                    for next_offset in offsets:
+                        pending[pool.submit(_playlist_page, sp, playlist_id, next_offset)] = (playlist_id,
+                                                                                              next_offset)
+                else:
+                    entry["pages"][offset] = page
+
+                if len(entry["pages"]) == entry["expected"]:
+                    fetch["playlists"] += 1
+                    fetch.setdefault("completed", []).append(playlist_id)
+                    for page_offset in sorted(entry["pages"]):
+                        yield [entry["pages"][page_offset]]
+                    collected[playlist_id] = {"failed": False, "done": True}
+
+
 def playlist_sync_auto(client=None):
     return playlist_to_db(client=client, list_id=None, list_type='auto')
 
@@ -132,33 +252,6 @@ def playlist_sync_seeds(client=None):
 def playlist_sync_one_time(client=None):
     return playlist_to_db(client=client, list_id=None, list_type='once')
 
-def playlist_reset(client=None, list_id=None):
-    if not list_id:
-        return client
-
-    client = get_spotify_client(client)
-    sp = client.get("client")
-    sp.playlist_replace_items(list_id, [])
-    return client
-
-def playlist_upload(client=None, list_id=None, track_list=None):
-    if not list_id or not track_list:
-        return client
-
-    client = get_spotify_client(client)
-    sp = client.get("client")
-    num_songs = len(track_list)
-    if num_songs < 100:
-        batch_size = num_songs
-    else:
-        batch_size = 100
-
-    for i in range(0, len(track_list), batch_size):
-        batch = track_list[i:i + batch_size]
-        if len(batch) > 0:
-            sp.playlist_add_items(list_id, batch)
-    return client
-
 def ensure_playlist_relationships(client):
     del_sql = """DELETE FROM music.playlist_relationships pr
                 WHERE pr.child_playlist_id in
@@ -233,24 +326,65 @@ def gen_playlist(client, name, description):
 
 
 def auto_shuffle_playlists():
-    sql = "SELECT DISTINCT playlist_id from music.playlist_config WHERE is_active and auto_shuffle"
-    playlists = sql_to_list(sql)
-    client=None
-    for l in playlists:
-        sql = f"""SELECT DISTINCT target_playlist_id, track_id,
-            default_new_order 
-            FROM music.vw_playlist_isrc_stats WHERE playlist_id = '{l}'
-            ORDER BY default_new_order asc;"""
-        df = pd.read_sql(sql, get_conn(alchemy=True))
-        if df.empty:
-            continue
-
-        id = df['target_playlist_id'].iloc[0]
-        track_list = df['track_id'].to_list()
-        client = playlist_reset(None, id)
-        client = playlist_upload(client, id, track_list)
-        continue
-    return
+    # One query returns the tracks and shuffle settings of every auto_shuffle playlist;
+    # each order is drawn by the shuffle engine with the playlist's weights. Uploads
+    # share one Spotify client and run on a bounded pool. Each upload is logged to
+    # logging.task_executions as 'Auto Shuffle Upload' with the playlist in task_detail;
+    # the shared query time is reported once, as the parent task's extract time.
+    t0 = start_timer()
+    sql = """SELECT s.*, pc.ratings_weight, pc.recency_weight, pc.randomness_weight, pc.minutes_to_sync
+            FROM music.vw_playlist_isrc_stats s
+            INNER JOIN music.playlist_config pc ON pc.playlist_id = s.playlist_id
+            WHERE pc.is_active AND pc.auto_shuffle
+            ORDER BY s.playlist_id, s.default_new_order ASC;"""
+    playlists = {}
+    for row in sql_to_dict(sql) or []:
+        rows = playlists.setdefault(row["playlist_id"], {})
+        rows.setdefault(row["track_id"], row)
+
+    uploads = {}
+    for playlist_id, rows in playlists.items():
+        rows = list(rows.values())
+        first = rows[0]
+        seed = new_seed()
+        weights = shuffle_weights([r.get("ratings_pct") for r in rows], [r.get("recency_pct") for r in rows],
+                                  first.get("ratings_weight") or 0, first.get("recency_weight") or 0,
+                                  first.get("randomness_weight") or 0)
+        order = shuffle_order(weights,
+                              durations_s=[r.get("duration_s") for r in rows],
+                              budget_minutes=first.get("minutes_to_sync"),
+                              artists=[r["artist_id"] for r in rows] if "artist_id" in first else None,
+                              albums=[r["album_id"] for r in rows] if "album_id" in first else None,
+                              seed=seed)
+        uploads[playlist_id] = {"target": first["target_playlist_id"],
+                                "tracks": [rows[i]["track_id"] for i in order],
+                                "seed": seed}
+    query_ms = elapsed_ms(t0)
+    if not uploads:
+        return {"task_timings": {"e_time": query_ms}}
+
+    client = get_spotify_client(None)
+
+    def upload_one(playlist_id, upload):
+        u0 = start_timer()
+        detail = f"{playlist_id} -> {upload['target']}: {len(upload['tracks'])} tracks, seed {upload['seed']}"
+        try:
+            _client, summary = sync_playlist(client, upload["target"], upload["tracks"])
+        except Exception as e:
+            task_log(task_name='Auto Shuffle Upload', t_time=elapsed_ms(u0),
+                     fail_type='upload', fail_text=str(e), task_detail=detail)
+            return False
+        task_log(task_name='Auto Shuffle Upload', t_time=elapsed_ms(u0),
+                 task_detail=f"{detail}, {summary['mode']} in {summary['calls']} call(s)")
+        return True
+
+    with ThreadPoolExecutor(max_workers=AUTO_SHUFFLE_WORKERS, thread_name_prefix="shuffle-upload") as pool:
+        results = list(pool.map(lambda item: upload_one(*item), uploads.items()))
+
+    failed = results.count(False)
+    if failed:
+        raise RuntimeError(f"{failed} of {len(results)} auto-shuffle upload(s) failed")
+    return {"task_timings": {"e_time": query_ms}}
 
 
 def get_now_playing(client=None):
@@ -0,0 +1,344 @@
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from backend_functions.database_functions import con_cur, sql_to_dict, get_log_tables
+
+load_dotenv()
+
+# Range partitioning of logging.* tables on event_time_utc.
+# Partitions are named <table>_pYYYYMM (monthly) or <table>_pYYYYMMDD (daily) plus
+# <table>_default for NULL / out-of-range rows. Retention detaches and drops whole
+# partitions instead of deleting rows, so no bloat is left behind for VACUUM FULL.
+#   python -m backend_functions.partition_manager --convert [table ...]
+
+LOG_PARTITION_GRAIN = os.getenv("LOG_PARTITION_GRAIN", "month")  # month | day
+LOG_PARTITION_PREMAKE = int(os.getenv("LOG_PARTITION_PREMAKE", 3))
+
+_SUFFIX = re.compile(r"_p(\d{8}|\d{6})$")
+
+
+def _period_start(d, grain):
+    return d if grain == "day" else d.replace(day=1)
+
+
+def _next_period(d, grain):
+    if grain == "day":
+        return d + timedelta(days=1)
+    return (d.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _partition_name(table, start, grain):
+    return f"{table}_p{start:%Y%m%d}" if grain == "day" else f"{table}_p{start:%Y%m}"
+
+
+def _partition_bounds(name):
+    # (start, end) parsed from the partition suffix; None for the default partition
+    match = _SUFFIX.search(name)
+    if not match:
+        return None
+    suffix = match.group(1)
+    if len(suffix) == 8:
+        start = datetime.strptime(suffix, "%Y%m%d").date()
+        return start, _next_period(start, "day")
+    start = datetime.strptime(suffix, "%Y%m").date()
+    return start, _next_period(start, "month")
+
+
+def is_partitioned(table):
+    sql = f"""SELECT c.relkind FROM pg_catalog.pg_class c
+              JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+              WHERE n.nspname = 'logging' AND c.relname = '{table}'"""
+    rows = sql_to_dict(sql)
+    return bool(rows) and rows[0].get("relkind") == 'p'
+
+
+def list_partitions(table):
+    sql = f"""SELECT child.relname AS partition_name
+              FROM pg_catalog.pg_inherits i
+              JOIN pg_catalog.pg_class parent ON parent.oid = i.inhparent
+              JOIN pg_catalog.pg_class child ON child.oid = i.inhrelid
+              JOIN pg_catalog.pg_namespace n ON n.oid = parent.relnamespace
+              WHERE n.nspname = 'logging' AND parent.relname = '{table}'
+              ORDER BY child.relname"""
+    return [row["partition_name"] for row in sql_to_dict(sql)]
+
+
+def _create_partition_sql(parent, name, start, grain):
+    end = _next_period(start, grain)
+    return (f"CREATE TABLE IF NOT EXISTS logging.{name} PARTITION OF logging.{parent} "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}');")
+
+
+def _period_range(first, last, grain):
+    period = _period_start(first, grain)
+    while period <= last:
+        yield period
+        period = _next_period(period, grain)
+
+
+def ensure_partitions(table, grain=None, ahead=None):
+    # Pre-creates the current period and the next `ahead` periods
+    grain = grain or LOG_PARTITION_GRAIN
+    ahead = LOG_PARTITION_PREMAKE if ahead is None else ahead
+    existing = set(list_partitions(table))
+
+    period = _period_start(datetime.now(timezone.utc).date(), grain)
+    created = []
+    conn, cur = con_cur()
+    try:
+        for _ in range(ahead + 1):
+            name = _partition_name(table, period, grain)
+            if name not in existing:
+                cur.execute(_create_partition_sql(table, name, period, grain))
+                created.append(name)
+            period = _next_period(period, grain)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    return created
+
+
+def drop_expired_partitions(table, days_to_keep):
+    # Detaches and drops partitions whose whole range is older than the retention window
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=days_to_keep)
+    dropped = []
+    conn, cur = con_cur()
+    try:
+        for name in list_partitions(table):
+            bounds = _partition_bounds(name)
+            if bounds is None or bounds[1] > cutoff:
+                continue
+            cur.execute(f"ALTER TABLE logging.{table} DETACH PARTITION logging.{name};")
+            cur.execute(f"DROP TABLE logging.{name};")
+            dropped.append(name)
+        # Rows that landed in the default partition are few; delete them normally
+        if f"{table}_default" in list_partitions(table):
+            cur.execute(f"DELETE FROM logging.{table}_default WHERE event_time_utc < %s;", (cutoff,))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+    return dropped
+
+
+def _dependent_views(cur, table):
+    # Views/matviews that depend on the table (directly or through other views),
+    # ordered so each can be recreated after the ones it depends on
+    cur.execute("""
+        WITH RECURSIVE deps AS (
+            SELECT DISTINCT v.oid, 1 AS depth
+            FROM pg_catalog.pg_depend d
+            JOIN pg_catalog.pg_rewrite r ON r.oid = d.objid
+            JOIN pg_catalog.pg_class v ON v.oid = r.ev_class
+            WHERE d.refobjid = %s::regclass AND v.oid <> %s::regclass
+            UNION
+            SELECT v.oid, deps.depth + 1
+            FROM deps
+            JOIN pg_catalog.pg_depend d ON d.refobjid = deps.oid
+            JOIN pg_catalog.pg_rewrite r ON r.oid = d.objid
+            JOIN pg_catalog.pg_class v ON v.oid = r.ev_class
+            WHERE v.oid <> deps.oid
+        )
+        SELECT n.nspname, c.relname, c.relkind, pg_catalog.pg_get_viewdef(c.oid) AS definition,
+               MAX(deps.depth) AS depth,
+               ARRAY(SELECT pg_catalog.pg_get_indexdef(i.indexrelid)
+                     FROM pg_catalog.pg_index i WHERE i.indrelid = c.oid) AS indexes
+        FROM deps
+        JOIN pg_catalog.pg_class c ON c.oid = deps.oid
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        GROUP BY n.nspname, c.relname, c.relkind, c.oid
+        ORDER BY depth;""", (f"logging.{table}", f"logging.{table}"))
+    return cur.fetchall()
+
+
+def _privileges(cur, relation):
+    # Owner and the GRANT statements that reproduce the relation's ACL
+    cur.execute("""SELECT quote_ident(pg_catalog.pg_get_userbyid(c.relowner)),
+                          CASE WHEN a.grantee = 0 THEN 'PUBLIC'
+                               ELSE quote_ident(pg_catalog.pg_get_userbyid(a.grantee)) END,
+                          a.privilege_type, a.is_grantable, a.grantee = c.relowner
+                   FROM pg_catalog.pg_class c
+                   LEFT JOIN LATERAL aclexplode(c.relacl) a ON TRUE
+                   WHERE c.oid = %s::regclass;""", (relation,))
+    rows = cur.fetchall()
+    owner = rows[0][0] if rows else None
+    grants = [f"GRANT {privilege} ON {relation} TO {grantee}{' WITH GRANT OPTION' if grantable else ''};"
+              for _owner, grantee, privilege, grantable, is_owner in rows
+              if privilege is not None and not is_owner]
+    return owner, grants
+
+
+def _restore_privileges(cur, relation, owner, grants, kind_sql="TABLE"):
+    if owner:
+        cur.execute(f"ALTER {kind_sql} {relation} OWNER TO {owner};")
+    for grant in grants:
+        cur.execute(grant)
+
+
+def convert_to_partitioned(table, grain=None):
+    # Rebuilds logging.<table> as a range-partitioned table in a single transaction:
+    # captures dependent views, copies the rows, swaps the tables and recreates the views.
+    # Owner, grants, CHECK and foreign-key constraints, indexes and triggers are carried
+    # over. Primary key / unique constraints and unique indexes gain event_time_utc (a
+    # partitioned table's unique keys must include the partition key). Tables referenced
+    # by other tables' foreign keys are not converted: those references would have to be dropped.
+    grain = grain or LOG_PARTITION_GRAIN
+    if is_partitioned(table):
+        return False
+
+    relation = f"logging.{table}"
+    conn, cur = con_cur()
+    try:
+        cur.execute("""SELECT conname, conrelid::regclass::TEXT FROM pg_catalog.pg_constraint
+                       WHERE contype = 'f' AND confrelid = %s::regclass AND conrelid <> confrelid;""",
+                    (relation,))
+        referencing = cur.fetchall()
+        if referencing:
+            raise RuntimeError(f"{relation} is referenced by foreign keys "
+                               f"{', '.join(f'{t}.{c}' for c, t in referencing)}; not converting")
+
+        views = _dependent_views(cur, table)
+        view_privileges = {(schema, name): _privileges(cur, f"{schema}.{name}")
+                           for schema, name, *_rest in views}
+        owner, grants = _privileges(cur, relation)
+
+        # Keys and constraints to recreate once the new table has the old name
+        cur.execute("""SELECT conname, contype, pg_catalog.pg_get_constraintdef(oid),
+                              ARRAY(SELECT a.attname FROM pg_catalog.pg_attribute a
+                                    WHERE a.attrelid = conrelid AND a.attnum = ANY(conkey))
+                       FROM pg_catalog.pg_constraint
+                       WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')
+                       ORDER BY contype DESC;""", (relation,))
+        constraints = cur.fetchall()
+
+        # Indexes that don't back a constraint; unique ones are rebuilt from their columns
+        cur.execute("""SELECT ic.relname, pg_catalog.pg_get_indexdef(i.indexrelid),
+                              i.indisunique AND i.indexprs IS NULL,
+                              ARRAY(SELECT a.attname
+                                    FROM unnest(i.indkey::SMALLINT[]) WITH ORDINALITY k(attnum, ord)
+                                    JOIN pg_catalog.pg_attribute a
+                                      ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                                    ORDER BY k.ord),
+                              pg_catalog.pg_get_expr(i.indpred, i.indrelid)
+                       FROM pg_catalog.pg_index i
+                       JOIN pg_catalog.pg_class ic ON ic.oid = i.indexrelid
+                       WHERE i.indrelid = %s::regclass
+                         AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_constraint c
+                                         WHERE c.conindid = i.indexrelid);""", (relation,))
+        table_indexes = cur.fetchall()
+
+        cur.execute("""SELECT tgname, pg_catalog.pg_get_triggerdef(oid), tgenabled
+                       FROM pg_catalog.pg_trigger
+                       WHERE tgrelid = %s::regclass AND NOT tgisinternal;""", (relation,))
+        triggers = cur.fetchall()
+
+        cur.execute(f"SELECT MIN(event_time_utc)::DATE FROM logging.{table};")
+        first = cur.fetchone()[0] or datetime.now(timezone.utc).date()
+
+        # Sequences owned by the old table must survive its DROP
+        cur.execute("""SELECT a.attname, a.attidentity, pg_catalog.pg_get_serial_sequence(%s, a.attname)
+                       FROM pg_catalog.pg_attribute a
+                       WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+                         AND pg_catalog.pg_get_serial_sequence(%s, a.attname) IS NOT NULL;""",
+                    (f"logging.{table}", f"logging.{table}", f"logging.{table}"))
+        sequences = cur.fetchall()
+
+        new_table = f"{table}_partitioned"
+        cur.execute(f"""CREATE TABLE logging.{new_table}
+                        (LIKE logging.{table} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)
+                        PARTITION BY RANGE (event_time_utc);""")
+
+        for column, identity, sequence in sequences:
+            if identity:
+                # Identity columns are not supported on partitioned tables before PG 17;
+                # keep numbering going from a plain sequence instead
+                cur.execute(f"ALTER TABLE logging.{table} ALTER COLUMN {column} DROP IDENTITY;")
+                sequence = f"logging.{table}_{column}_seq"
+                cur.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence};")
+                cur.execute(f"SELECT setval('{sequence}', COALESCE(MAX({column}), 0) + 1, false) "
+                            f"FROM logging.{table};")
+                cur.execute(f"ALTER TABLE logging.{new_table} ALTER COLUMN {column} "
+                            f"SET DEFAULT nextval('{sequence}');")
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY logging.{new_table}.{column};")
+
+        today = datetime.now(timezone.utc).date()
+        last = today
+        for _ in range(LOG_PARTITION_PREMAKE):
+            last = _next_period(_period_start(last, grain), grain)
+        for period in _period_range(first, last, grain):
+            cur.execute(_create_partition_sql(new_table, _partition_name(table, period, grain), period, grain))
+        cur.execute(f"CREATE TABLE logging.{table}_default PARTITION OF logging.{new_table} DEFAULT;")
+
+        cur.execute(f"INSERT INTO logging.{new_table} SELECT * FROM logging.{table};")
+        cur.execute(f"DROP TABLE logging.{table} CASCADE;")
+        cur.execute(f"ALTER TABLE logging.{new_table} RENAME TO {table};")
+
+        for name, definition, unique, columns, predicate in table_indexes:
+            # Unique expression indexes have no plain column list to extend; their original
+            # definition fails here and rolls the conversion back
+            if unique and 'event_time_utc' not in columns:
+                where = f" WHERE {predicate}" if predicate else ""
+                definition = (f"CREATE UNIQUE INDEX {name} ON {relation} "
+                              f"({', '.join(list(columns) + ['event_time_utc'])}){where}")
+            cur.execute(f"{definition};")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_event_time ON logging.{table} (event_time_utc);")
+        for name, kind, definition, columns in constraints:
+            if kind == 'f':
+                cur.execute(f"ALTER TABLE {relation} ADD CONSTRAINT {name} {definition};")
+                continue
+            # Fails (and rolls everything back) if event_time_utc has NULLs under a primary key
+            key = list(columns) + ([] if 'event_time_utc' in columns else ['event_time_utc'])
+            kind_sql = "PRIMARY KEY" if kind == 'p' else "UNIQUE"
+            cur.execute(f"ALTER TABLE {relation} ADD CONSTRAINT {name} {kind_sql} ({', '.join(key)});")
+        for name, definition, enabled in triggers:
+            cur.execute(f"{definition};")
+            if enabled == 'D':
+                cur.execute(f"ALTER TABLE {relation} DISABLE TRIGGER {name};")
+        _restore_privileges(cur, relation, owner, grants)
+
+        for schema, name, kind, definition, _depth, indexes in views:
+            kind_sql = "MATERIALIZED VIEW" if kind == 'm' else "VIEW"
+            cur.execute(f"CREATE {kind_sql} {schema}.{name} AS {definition}")
+            for index_sql in indexes or []:
+                cur.execute(index_sql)
+            _restore_privileges(cur, f"{schema}.{name}", *view_privileges[(schema, name)], kind_sql=kind_sql)
+
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"logging.{table} converted to {grain}ly partitions, {len(views)} view(s) recreated")
+    return True
+
+
+def maintain_log_partitions(days_to_keep):
+    # Nightly: pre-create upcoming partitions and drop expired ones.
+    # Returns the log tables that are still plain tables (they need row deletes).
+    unpartitioned = []
+    for table in get_log_tables(as_list=True):
+        if not is_partitioned(table):
+            unpartitioned.append(table)
+            continue
+        created = ensure_partitions(table)
+        dropped = drop_expired_partitions(table, days_to_keep)
+        if created or dropped:
+            print(f"logging.{table}: created {created or 'none'}, dropped {dropped or 'none'}")
+    return unpartitioned
+
+
+if __name__ == "__main__":
+    if "--convert" in sys.argv:
+        tables = [a for a in sys.argv[1:] if not a.startswith("--")] or get_log_tables(as_list=True)
+        for log_table in tables:
+            try:
+                convert_to_partitioned(log_table)
+            except Exception as e:
+                print(f"logging.{log_table} not converted: {e}")
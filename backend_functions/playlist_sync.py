@@ -0,0 +1,39 @@
+import math
+
+from backend_functions.logging_functions import log_app_event, start_timer, elapsed_ms
+from backend_functions.rate_limiter import rate_limited_call
+from backend_functions.service_logins import get_spotify_client
+
+# Playlist writer. Every caller (auto shuffle, Send to Spotify) redraws the whole
+# order, so the playlist is rewritten without reading the remote order first:
+# replace the first 100 tracks, then append the rest, ceil(n/100) calls in all.
+
+SPOTIFY_BATCH = 100  # max items per add/replace call
+
+
+def replace_cost(n_tracks):
+    return max(1, math.ceil(n_tracks / SPOTIFY_BATCH))
+
+
+def replace_playlist(sp, playlist_id, track_list):
+    # Full rewrite: replace with the first 100 tracks, then append the rest
+    result = rate_limited_call('Spotify', sp.playlist_replace_items, playlist_id, track_list[:SPOTIFY_BATCH])
+    for i in range(SPOTIFY_BATCH, len(track_list), SPOTIFY_BATCH):
+        result = rate_limited_call('Spotify', sp.playlist_add_items, playlist_id, track_list[i:i + SPOTIFY_BATCH])
+    return (result or {}).get("snapshot_id")
+
+
+def sync_playlist(client=None, list_id=None, track_list=None):
+    # Makes the Spotify playlist match track_list in order.
+    # Returns the client and a summary: mode ('replace'), API calls used and elapsed ms.
+    if not list_id or track_list is None:
+        return client, None
+    t0 = start_timer()
+    client = get_spotify_client(client)
+    sp = client.get("client")
+
+    replace_playlist(sp, list_id, list(track_list))
+    summary = {"mode": "replace", "calls": replace_cost(len(track_list)), "ms": elapsed_ms(t0)}
+    log_app_event(cat='Playlist Write', desc=f"{list_id}: {summary['mode']}, {summary['calls']} call(s)",
+                  exec_time=summary["ms"])
+    return client, summary
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+# Adaptive per-service pacing for API loops (replaces fixed sleeps).
+# Each service has a minimum interval between calls that shrinks additively while
+# responses are healthy and grows multiplicatively on 429 / too-many-requests
+# errors (AIMD). A Retry-After header pauses the whole service for that long.
+
+RATE_START_INTERVAL_S = float(os.getenv("RATE_START_INTERVAL_S", 0.5))
+RATE_MIN_INTERVAL_S = float(os.getenv("RATE_MIN_INTERVAL_S", 0.1))
+RATE_MAX_INTERVAL_S = float(os.getenv("RATE_MAX_INTERVAL_S", 30))
+RATE_SPEEDUP_STEP_S = float(os.getenv("RATE_SPEEDUP_STEP_S", 0.05))
+RATE_BACKOFF_FACTOR = float(os.getenv("RATE_BACKOFF_FACTOR", 2.0))
+RATE_MAX_RETRIES = int(os.getenv("RATE_MAX_RETRIES", 4))
+
+_lock = threading.Lock()
+_limiters = {}
+
+
+def _limiter(service):
+    # Must be called with _lock held
+    if service not in _limiters:
+        _limiters[service] = {"interval_s": RATE_START_INTERVAL_S,
+                              "next_at": 0.0,
+                              "calls": 0,
+                              "throttles": 0,
+                              "slept_s": 0.0}
+    return _limiters[service]
+
+
+def acquire(service):
+    # Reserves the next call slot for the service and sleeps until it arrives
+    with _lock:
+        lim = _limiter(service)
+        now = time.monotonic()
+        start_at = max(now, lim["next_at"])
+        lim["next_at"] = start_at + lim["interval_s"]
+        lim["calls"] += 1
+        wait_s = start_at - now
+        lim["slept_s"] += wait_s
+    if wait_s > 0:
+        time.sleep(wait_s)
+
+
+def report_success(service):
+    with _lock:
+        lim = _limiter(service)
+        lim["interval_s"] = max(RATE_MIN_INTERVAL_S, lim["interval_s"] - RATE_SPEEDUP_STEP_S)
+
+
+def report_throttle(service, retry_after=None):
+    with _lock:
+        lim = _limiter(service)
+        lim["throttles"] += 1
+        lim["interval_s"] = min(RATE_MAX_INTERVAL_S, lim["interval_s"] * RATE_BACKOFF_FACTOR)
+        pause_s = retry_after if retry_after is not None else lim["interval_s"]
+        lim["next_at"] = max(lim["next_at"], time.monotonic() + pause_s)
+
+
+def is_throttle_error(e):
+    # spotipy SpotifyException / requests HTTPError with a 429, or garminconnect's error type
+    if type(e).__name__ == 'GarminConnectTooManyRequestsError':
+        return True
+    if getattr(e, "http_status", None) == 429:
+        return True
+    response = getattr(e, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+def retry_after_s(e):
+    headers = getattr(e, "headers", None) or getattr(getattr(e, "response", None), "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def rate_limited_call(service, fn, *args, **kwargs):
+    # Calls fn inside the service's rate budget, backing off and retrying when throttled
+    attempt = 0
+    while True:
+        acquire(service)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_throttle_error(e):
+                raise
+            report_throttle(service, retry_after_s(e))
+            attempt += 1
+            print(f"{service} throttled (attempt {attempt}): {e}")
+            if attempt > RATE_MAX_RETRIES:
+                raise
+            continue
+        report_success(service)
+        return result
+
+
+def limiter_stats():
+    with _lock:
+        return {service: dict(lim, interval_s=round(lim["interval_s"], 3), slept_s=round(lim["slept_s"], 1))
+                for service, lim in _limiters.items()}
+
+
+def _reset_after_fork():
+    # A forked child keeps the parent's pacing state but needs its own lock
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
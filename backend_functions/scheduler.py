@@ -0,0 +1,161 @@
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+from backend_functions.connection_pool import pool_stats
+from backend_functions.credential_management import key_timing
+from backend_functions.engine_registry import engine_stats
+from backend_functions.log_sink import sink_stats
+from backend_functions.logging_functions import log_app_event
+from backend_functions.rate_limiter import limiter_stats
+from backend_functions.service_logins import credential_cache_stats, start_spotify_refresher
+from backend_functions.task_execution import task_executioner
+
+load_dotenv()
+
+# Resident scheduler: runs task_executioner on its own tick so imports, key
+# derivation, DB pools and API clients stay warm between runs. Due-ness is still
+# decided per task from tasks.task_config (the view's rules, or interval_minutes
+# for sub-hourly cadences). A small HTTP endpoint reports health and metrics.
+
+SCHEDULER_TICK_S = int(os.getenv("SCHEDULER_TICK_S", 60))
+SCHEDULER_HEALTH_HOST = os.getenv("SCHEDULER_HEALTH_HOST", "127.0.0.1")
+SCHEDULER_HEALTH_PORT = int(os.getenv("SCHEDULER_HEALTH_PORT", 8765))
+# A tick older than this many intervals marks the daemon unhealthy
+SCHEDULER_STALE_TICKS = int(os.getenv("SCHEDULER_STALE_TICKS", 5))
+
+_stop = threading.Event()
+_state = {"started_utc": None,
+          "ticks": 0,
+          "tick_errors": 0,
+          "running": False,
+          "last_tick_utc": None,
+          "last_tick_ms": None,
+          "last_result": None,
+          "last_error": None,
+          "totals": {"executed": 0, "failed": 0}}
+_state_lock = threading.Lock()
+
+
+def run_tick():
+    # One scheduler pass; never raises so the loop keeps going
+    t0 = time.perf_counter()
+    with _state_lock:
+        _state["running"] = True
+    result, error = None, None
+    try:
+        result = task_executioner()
+    except Exception as e:
+        error = str(e)
+        log_app_event(cat="Scheduler", desc="Tick failed", err=error)
+
+    with _state_lock:
+        _state["running"] = False
+        _state["ticks"] += 1
+        _state["last_tick_utc"] = datetime.now(timezone.utc)
+        _state["last_tick_ms"] = int((time.perf_counter() - t0) * 1000)
+        _state["last_result"] = result
+        _state["last_error"] = error
+        if error:
+            _state["tick_errors"] += 1
+        if result:
+            _state["totals"]["executed"] += result.get("executed", 0)
+            _state["totals"]["failed"] += result.get("failed", 0)
+    return result
+
+
+def health(tick_s=None):
+    tick_s = tick_s or SCHEDULER_TICK_S
+    with _state_lock:
+        state = json.loads(json.dumps(_state, default=str))
+        last_tick = _state["last_tick_utc"]
+        started = _state["started_utc"]
+
+    now = datetime.now(timezone.utc)
+    reference = last_tick or started
+    age_s = (now - reference).total_seconds() if reference else None
+    # A long-running tick is not stale until it exceeds the window too
+    healthy = age_s is None or age_s <= tick_s * SCHEDULER_STALE_TICKS
+    state["healthy"] = healthy
+    state["last_tick_age_s"] = round(age_s, 1) if age_s is not None else None
+    return state
+
+
+def metrics():
+    return {"scheduler": health(),
+            "db_pool": pool_stats(),
+            "engines": engine_stats(),
+            "rate_limits": limiter_stats(),
+            "log_sink": sink_stats(),
+            "key": key_timing(),
+            "credentials": credential_cache_stats()}
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("", "/health"):
+            body = health()
+            code = 200 if body["healthy"] else 503
+        elif self.path.rstrip("/") == "/metrics":
+            body = metrics()
+            code = 200
+        else:
+            body = {"error": "not found"}
+            code = 404
+        payload = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Health probes would otherwise flood the service log
+        return
+
+
+def start_health_server(host=None, port=None):
+    host = host or SCHEDULER_HEALTH_HOST
+    port = SCHEDULER_HEALTH_PORT if port is None else port
+    server = ThreadingHTTPServer((host, port), _HealthHandler)
+    thread = threading.Thread(target=server.serve_forever, name="scheduler-health", daemon=True)
+    thread.start()
+    print(f"Scheduler health endpoint on http://{host}:{port}/health")
+    return server
+
+
+def stop_scheduler(*_args):
+    _stop.set()
+
+
+def run_scheduler(tick_s=None, health_port=None):
+    # Ticks on wall-clock multiples of tick_s until SIGTERM/SIGINT
+    tick_s = tick_s or SCHEDULER_TICK_S
+    with _state_lock:
+        _state["started_utc"] = datetime.now(timezone.utc)
+
+    signal.signal(signal.SIGTERM, stop_scheduler)
+    signal.signal(signal.SIGINT, stop_scheduler)
+
+    server = None
+    if health_port != 0:
+        server = start_health_server(port=health_port)
+
+    start_spotify_refresher()
+    log_app_event(cat="Scheduler", desc=f"Started, tick every {tick_s}s")
+    try:
+        while not _stop.is_set():
+            run_tick()
+            # Sleep to the next boundary; a slow tick just skips the boundaries it overran
+            _stop.wait(tick_s - (time.time() % tick_s))
+    finally:
+        if server is not None:
+            server.shutdown()
+        log_app_event(cat="Scheduler", desc=f"Stopped after {_state['ticks']} tick(s)")
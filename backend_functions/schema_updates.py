@@ -0,0 +1,93 @@
+from backend_functions.database_functions import qec
+
+# Idempotent DDL for columns/tables the python code relies on that were added
+# after the original schema was built. Safe to run on every process start.
+
+SCHEMA_UPDATES = [
+    # Load throughput per task execution
+    """ALTER TABLE logging.task_executions
+        ADD COLUMN IF NOT EXISTS rows_loaded BIGINT,
+        ADD COLUMN IF NOT EXISTS bytes_loaded BIGINT,
+        ADD COLUMN IF NOT EXISTS load_rows_per_s NUMERIC,
+        ADD COLUMN IF NOT EXISTS load_bytes_per_s NUMERIC;""",
+    # Optional concurrency lane override (defaults to the api service / python_function)
+    """ALTER TABLE tasks.task_config
+        ADD COLUMN IF NOT EXISTS execution_lane TEXT;""",
+    # Per-window progress of date-looped tasks and backfills
+    """CREATE TABLE IF NOT EXISTS tasks.task_checkpoints (
+        task_name TEXT NOT NULL,
+        window_start DATE NOT NULL,
+        window_end DATE NOT NULL,
+        rows_loaded BIGINT,
+        completed_utc TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (task_name, window_start));""",
+    # Payload dedupe on staging.api_imports (opt-in per task)
+    """CREATE TABLE IF NOT EXISTS staging.api_payload_hashes (
+        api_function_name TEXT NOT NULL,
+        payload_hash TEXT NOT NULL,
+        first_seen_utc TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (api_function_name, payload_hash));""",
+    """CREATE INDEX IF NOT EXISTS ix_api_payload_hashes_first_seen
+        ON staging.api_payload_hashes (first_seen_utc);""",
+    """ALTER TABLE tasks.task_config
+        ADD COLUMN IF NOT EXISTS dedupe_payloads BOOLEAN NOT NULL DEFAULT FALSE;""",
+    """ALTER TABLE logging.task_executions
+        ADD COLUMN IF NOT EXISTS duplicates_skipped BIGINT;""",
+    # Optional sub-hourly cadence, evaluated by the scheduler daemon's tick
+    """ALTER TABLE tasks.task_config
+        ADD COLUMN IF NOT EXISTS interval_minutes INTEGER;""",
+    # Encrypted API session tokens (e.g. garth dumps) reused across processes
+    """CREATE TABLE IF NOT EXISTS api_services.session_tokens (
+        api_service_name TEXT PRIMARY KEY,
+        session_token TEXT NOT NULL,
+        updated_utc TIMESTAMPTZ NOT NULL DEFAULT NOW());""",
+    # Aggregated API events (one row stands for event_count occurrences)
+    """ALTER TABLE logging.api_logins
+        ADD COLUMN IF NOT EXISTS event_count INTEGER NOT NULL DEFAULT 1;""",
+    # Per-table maintenance actions (NULL table_name = nightly summary row)
+    """ALTER TABLE logging.db_stats
+        ADD COLUMN IF NOT EXISTS table_name TEXT;""",
+    # Backup duration / size / verification metrics
+    """CREATE TABLE IF NOT EXISTS logging.backup_log (
+        event_time_utc TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        backup_path TEXT,
+        backup_format TEXT,
+        jobs INTEGER,
+        compress_level INTEGER,
+        duration_ms BIGINT,
+        size_mb NUMERIC,
+        verified BOOLEAN,
+        restore_verified BOOLEAN,
+        restore_ms BIGINT,
+        error_text TEXT);""",
+    # Lets the task summary matview refresh CONCURRENTLY (one row per task)
+    """CREATE UNIQUE INDEX IF NOT EXISTS ux_vw_task_summary_chart_task_name
+        ON tasks.vw_task_summary_chart_materialized (task_name);""",
+    # Per-task wall-clock budget in seconds (NULL / 0 = run in-process, no isolation)
+    """ALTER TABLE tasks.task_config
+        ADD COLUMN IF NOT EXISTS timeout_s INTEGER;""",
+    # Spotify snapshot_id of the last synced version of each playlist
+    """ALTER TABLE music.playlist_config
+        ADD COLUMN IF NOT EXISTS snapshot_id TEXT;""",
+    # Sub-task context for a task_executions row (e.g. which playlist an upload was for)
+    """ALTER TABLE logging.task_executions
+        ADD COLUMN IF NOT EXISTS task_detail TEXT;""",
+]
+
+_schema_state = {"applied": False}
+
+
+def ensure_schema(force=False):
+    # Applies SCHEMA_UPDATES once per process
+    if _schema_state["applied"] and not force:
+        return []
+
+    errors = []
+    for ddl in SCHEMA_UPDATES:
+        e = qec(ddl)
+        if e:
+            print(f"Schema update failed: {e[0]}")
+            errors.append(e)
+
+    _schema_state["applied"] = True
+    return errors
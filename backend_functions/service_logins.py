@@ -1,18 +1,30 @@
 import importlib
 import os
+import threading
 import time
+import requests
 import spotipy
 from dotenv import load_dotenv
 from garminconnect import Garmin, GarminConnectAuthenticationError, GarminConnectTooManyRequestsError, \
     GarminConnectConnectionError
 from spotipy import SpotifyOAuth
 from pathlib import Path
-from backend_functions.credential_management import decrypt_dict
-from backend_functions.database_functions import one_sql_result, get_conn
-from backend_functions.logging_functions import log_api_event, log_app_event, start_timer, elapsed_ms
+from backend_functions.credential_management import decrypt_dict, encrypt_dict
+from backend_functions.database_functions import one_sql_result, get_conn, qec
+from backend_functions.logging_functions import log_api_event, log_app_event, start_timer, elapsed_ms, \
+    count_api_event
 
 load_dotenv()
 
+# Decrypted credentials are cached per service for CREDENTIAL_CACHE_TTL_S so token
+# refreshes and re-logins within a run skip the database and Fernet decrypt.
+# Anything that writes api_services.credentials must call invalidate_credentials.
+CREDENTIAL_CACHE_TTL_S = int(os.getenv("CREDENTIAL_CACHE_TTL_S", 900))
+
+_cred_lock = threading.Lock()
+_cred_cache = {}
+_cred_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
 
 def load_api_credentials(service=None):
     # loads and decrypts credentials for a specific service
@@ -20,6 +32,13 @@ def load_api_credentials(service=None):
         print('No service provided')
         return None
 
+    with _cred_lock:
+        cached = _cred_cache.get(service)
+        if cached is not None and cached[0] > time.monotonic():
+            _cred_stats["hits"] += 1
+            return dict(cached[1])
+        _cred_stats["misses"] += 1
+
     t_sql = f"""
         SELECT api_credentials FROM api_services.credentials 
         WHERE api_service_name = '{service}';"""
@@ -27,12 +46,37 @@ def load_api_credentials(service=None):
     result = one_sql_result(t_sql)
 
     if result:
-        return decrypt_dict(result)
+        creds = decrypt_dict(result)
+        with _cred_lock:
+            _cred_cache[service] = (time.monotonic() + CREDENTIAL_CACHE_TTL_S, creds)
+        return dict(creds)
     else:
         print(f'No results returned for service: {service}')
         return None
 
 
+def invalidate_credentials(service=None):
+    # Drops the cached credentials for one service (or all of them)
+    with _cred_lock:
+        if service is None:
+            _cred_cache.clear()
+        else:
+            _cred_cache.pop(service, None)
+        _cred_stats["invalidations"] += 1
+
+    if service in (None, 'Spotify'):
+        # The OAuth manager and client were built from the old credentials
+        with _spotify_lock:
+            _spotify.update({"auth": None, "client": None, "token_info": None, "token_time": None})
+
+
+def credential_cache_stats():
+    with _cred_lock:
+        stats = dict(_cred_stats)
+        stats["cached_services"] = len(_cred_cache)
+    return stats
+
+
 def spotify_creds():
     creds = load_api_credentials('Spotify')
     if 'client_id' in creds:
@@ -67,102 +111,241 @@ def garmin_creds():
     return e, p
 
 
-def get_spotify_client(incoming_token=None):
-    # tests validity of incoming token and returns a client & token
-    if incoming_token is None:
-        new_spotify_token = get_spotify_token()
-        new_spotify_token = insert_client(new_spotify_token, spotipy.Spotify(auth=new_spotify_token["token"]))
-        log_api_event('Spotify', 'New Token from none', token_age=0)
-        return new_spotify_token
+# Spotify token manager: one SpotifyOAuth + one spotipy client per process. The
+# token's expires_at is tracked locally and refreshed SPOTIFY_REFRESH_MARGIN_S
+# before expiry (inline, or by a background thread in long-lived processes), so
+# the hot path never needs a validation call. The client itself is built on the
+# auth manager, which spotipy consults before each request. The scheduler daemon
+# starts the refresher itself; SPOTIFY_BACKGROUND_REFRESH starts it elsewhere.
+SPOTIFY_REFRESH_MARGIN_S = int(os.getenv("SPOTIFY_REFRESH_MARGIN_S", 300))
+SPOTIFY_BACKGROUND_REFRESH = os.getenv("SPOTIFY_BACKGROUND_REFRESH", "false").lower() == "true"
+
+_spotify_lock = threading.RLock()
+_spotify = {"auth": None, "client": None, "token_info": None, "token_time": None, "refresher": None}
+
+
+def spotify_auth_manager():
+    # Builds the SpotifyOAuth manager once from the stored credentials
+    with _spotify_lock:
+        if _spotify["auth"] is not None:
+            return _spotify["auth"]
+
+        client_id, client_secret, redirect_uri = spotify_creds()
+        if not all([client_id, client_secret, redirect_uri]):
+            return None
+
+        # Declare the scope
+        scope_list = ['user-read-recently-played',
+                      'user-library-read',
+                      'user-modify-playback-state',
+                      'playlist-read-private',
+                      'playlist-read-collaborative',
+                      'playlist-modify-private',
+                      'playlist-modify-public',
+                      'playlist-read-private playlist-read-collaborative',
+                      "user-library-modify",
+                      'user-read-playback-state',
+                      'user-read-recently-played']
+        scope = ''
+        for scope_type in scope_list:
+            scope = scope + scope_type + ' '
+        scope = scope.strip()
+
+        cache_loc = Path(os.getenv("LOCAL_STORAGE_PATH"))
+
+        # Create the auth manager
+        _spotify["auth"] = SpotifyOAuth(
+            client_id=client_id,
+            client_secret=client_secret,
+            redirect_uri=redirect_uri,
+            scope=scope,
+            cache_path=os.path.join(cache_loc, ".spotify_cache")
+        )
+        return _spotify["auth"]
+
+
+def refresh_spotify_token(force=False):
+    # Returns current token info, refreshing it when it is within the margin of expiry
+    with _spotify_lock:
+        info = _spotify["token_info"]
+        if (not force and info and _spotify["client"] is not None
+                and info["expires_at"] - time.time() > SPOTIFY_REFRESH_MARGIN_S):
+            return info
+
+        t0 = start_timer()
+        auth_manager = spotify_auth_manager()
+        if auth_manager is None:
+            log_app_event(cat='API Login Failure', desc="Missing Spotify Credentials", exec_time=elapsed_ms(t0))
+            return None
 
-    if "token" not in incoming_token or "token_time" not in incoming_token:
-        new_spotify_token = get_spotify_token()
-        new_spotify_token = insert_client(new_spotify_token, spotipy.Spotify(auth=new_spotify_token["token"]))
-        log_api_event('Spotify', 'New Token from malformed dictionary', token_age=0)
-        return new_spotify_token
+        try:
+            if info and info.get("refresh_token"):
+                info = auth_manager.refresh_access_token(info["refresh_token"])
+                event = 'token refresh'
+            else:
+                info = auth_manager.get_access_token(as_dict=True)
+                event = 'login with New Token'
+                # The on-disk cache may hold a token that is about to expire
+                if info["expires_at"] - time.time() <= SPOTIFY_REFRESH_MARGIN_S:
+                    info = auth_manager.refresh_access_token(info["refresh_token"])
+                    event = 'login with refreshed Token'
+        except Exception as e:
+            log_api_event(service='Spotify', event='token acquisition failure', err=e)
+            # Rebuilt on the next attempt from the (TTL-refreshed) stored credentials
+            _spotify["auth"] = None
+            _spotify["client"] = None
+            return None
+
+        _spotify["token_info"] = info
+        _spotify["token_time"] = time.time()
+        if _spotify["client"] is None:
+            # refresh_access_token saved the new token to the manager's cache,
+            # where the client picks it up on its next request
+            _spotify["client"] = spotipy.Spotify(auth_manager=auth_manager)
+        log_api_event(service='Spotify', event=event, token_age=0)
+        return info
+
+
+def _spotify_refresh_loop():
+    while True:
+        with _spotify_lock:
+            info = _spotify["token_info"]
+        wait_s = 60 if info is None else info["expires_at"] - time.time() - SPOTIFY_REFRESH_MARGIN_S
+        if wait_s > 0:
+            time.sleep(min(wait_s, 600))
+            continue
+        if refresh_spotify_token() is None:
+            time.sleep(60)
+
+
+def start_spotify_refresher():
+    # Background refresh for long-lived processes (scheduler daemon, Streamlit)
+    with _spotify_lock:
+        if _spotify["refresher"] is not None and _spotify["refresher"].is_alive():
+            return
+        _spotify["refresher"] = threading.Thread(target=_spotify_refresh_loop,
+                                                 name="spotify-token-refresh", daemon=True)
+        _spotify["refresher"].start()
 
-    if incoming_token.get("client") is None:
-        new_spotify_token = get_spotify_token()
-        new_spotify_token = insert_client(new_spotify_token, spotipy.Spotify(auth=new_spotify_token["token"]))
-        log_api_event('Spotify', 'New Token from missing/none client', token_age=0)
-        return new_spotify_token
 
+def get_spotify_client(incoming_token=None):
+    # Returns the process-wide client & token; incoming_token is accepted for
+    # backwards compatibility, the shared client is always current
+    with _spotify_lock:
+        # Read together so a concurrent refresh or invalidation can't mix two tokens
+        info = refresh_spotify_token()
+        client, token_time = _spotify["client"], _spotify["token_time"]
+    if info is None:
+        return {"client": None, "token": None, "token_time": None}
 
-    token_age = time.time() - incoming_token["token_time"]
-    max_age = 1800 # seconds
-    if token_age > max_age: #test token validity
-        try:
-            cl = incoming_token.get("client")
-            cl.current_user()
-            log_api_event('Spotify', 'Token reuse: client still active', token_age=token_age)
-            return incoming_token
-        except Exception as e:
-            # dbf.log_entry(cat="API Login", desc=f"Token invalid @ {round(token_age / 60, 0)}m old.")
-            new_spotify_token = get_spotify_token()
-            new_spotify_token = insert_client(new_spotify_token, spotipy.Spotify(auth=new_spotify_token["token"]))
-            log_api_event('Spotify', 'New Token from expired', token_age=token_age)
-            return new_spotify_token
-    else:
-        log_api_event('Spotify', 'Token Reuse, check skipped', token_age=token_age)
-        return incoming_token
+    if SPOTIFY_BACKGROUND_REFRESH:
+        start_spotify_refresher()
+
+    count_api_event('Spotify', 'Token reuse', token_age=time.time() - token_time)
+    return {"client": client,
+            "token": info["access_token"],
+            "token_time": token_time,
+            "expires_at": info["expires_at"]}
 
 
 def get_spotify_token():
     # Retrieve the Spotify credentials from the database
-    # Attempt a login with the appropriate scopes
-    # Load the login state to session state
-    t0=start_timer()
-    client_id, client_secret, redirect_uri = spotify_creds()
+    # Attempt a login with the appropriate scopes (or reuse the managed token)
+    with _spotify_lock:
+        info = refresh_spotify_token()
+        token_time = _spotify["token_time"]
+    if info is None:
+        return None
+    return {"client": None,
+            "token": info["access_token"],
+            "token_time": token_time}
+
 
-    if not all([client_id, client_secret, redirect_uri]):
-        log_app_event(cat='API Login Failure', desc="Missing Spotify Credentials", exec_time=elapsed_ms(t0))
+def load_session_token(service):
+    # Returns the decrypted session payload stored for a service, or None
+    t_sql = f"""
+        SELECT session_token FROM api_services.session_tokens
+        WHERE api_service_name = '{service}';"""
+    try:
+        result = one_sql_result(t_sql)
+        return decrypt_dict(result) if result else None
+    except Exception as e:
+        print(f"Could not load {service} session token: {e}")
         return None
 
-    # Declare the scope
-    scope_list = ['user-read-recently-played',
-                  'user-library-read',
-                  'user-modify-playback-state',
-                  'playlist-read-private',
-                  'playlist-read-collaborative',
-                  'playlist-modify-private',
-                  'playlist-modify-public',
-                  'playlist-read-private playlist-read-collaborative',
-                  "user-library-modify",
-                  'user-read-playback-state',
-                  'user-read-recently-played']
-    scope = ''
-    for scope_type in scope_list:
-        scope = scope + scope_type + ' '
-    scope = scope.strip()
-
-    cache_loc = Path(os.getenv("LOCAL_STORAGE_PATH"))
-
-    # Create the auth manager
-    auth_manager = SpotifyOAuth(
-        client_id=client_id,
-        client_secret=client_secret,
-        redirect_uri=redirect_uri,
-        scope=scope,
-        cache_path=os.path.join(cache_loc, ".spotify_cache")
-    )
+
+def save_session_token(service, session):
+    insert_sql = """INSERT INTO api_services.session_tokens (api_service_name, session_token)
+                    VALUES (%s, %s)
+                    ON CONFLICT (api_service_name)
+                    DO UPDATE SET session_token = EXCLUDED.session_token, updated_utc = NOW();"""
+    qec(insert_sql, (service, encrypt_dict(session)))
+
+
+def clear_session_token(service):
+    qec("DELETE FROM api_services.session_tokens WHERE api_service_name = %s", (service,))
+
+
+# Last garth session written to the database by this process
+_garmin_session = {"dump": None}
+
+
+def persist_garmin_session(client):
+    # garth refreshes its OAuth2 token transparently; store it whenever it changed
+    try:
+        dump = client.garth.dumps()
+    except Exception as e:
+        print(f"Could not serialize Garmin session: {e}")
+        return
+    if dump == _garmin_session["dump"]:
+        return
+    save_session_token('Garmin', {"garth": dump})
+    _garmin_session["dump"] = dump
+
+
+def _session_rejected(e):
+    # garminconnect's auth error, or a garth HTTP error (GarthHTTPError.error is the requests error) with a 401
+    if isinstance(e, GarminConnectAuthenticationError):
+        return True
+    response = getattr(getattr(e, "error", e), "response", None)
+    return getattr(response, "status_code", None) == 401
+
+
+def garmin_resume():
+    # Rebuilds a client from the stored garth session; None when missing or rejected
+    session = load_session_token('Garmin')
+    if not session or not session.get("garth"):
+        return None
 
     try:
-        token_info = auth_manager.get_access_token(as_dict=True)
-        access_token = token_info["access_token"]
-        login_time = time.time()
-        log_api_event(service='Spotify', event='login with New Token')
-        final_token = {"client": None,
-                       "token": access_token,
-                       "token_time": login_time}
-        return final_token
+        client = Garmin()
+        # Strings longer than 512 chars are treated as a garth.dumps() payload
+        client.login(session["garth"])
+    except GarminConnectTooManyRequestsError as e:
+        log_api_event(service='Garmin', event='session resume failure, too many requests', err=e)
+        return None
     except Exception as e:
-        log_api_event(service='Spotify', event='token acquisition failure', err=e)
+        # Only a rejected session is dropped; network errors and outages keep it for the next try
+        if _session_rejected(e):
+            log_api_event(service='Garmin', event='session resume failure, session rejected', err=e)
+            clear_session_token('Garmin')
+        else:
+            log_api_event(service='Garmin', event='session resume failure', err=e)
         return None
 
+    _garmin_session["dump"] = session["garth"]
+    persist_garmin_session(client)
+    log_api_event(service='Garmin', event='session resume')
+    return client
+
 
 def garmin_login():
-    # This function will retrieve garmin credentials and attempt to login.
+    # Resumes the stored Garmin session when possible; otherwise retrieves garmin
+    # credentials and attempts a full login, then stores the new session.
     # If the credentials do not exist or the login attempt fails, user will be reprompted to enter credentials.
+    client = garmin_resume()
+    if client is not None:
+        return client
 
     sql = """SELECT seconds_since_last_event FROM logging.vw_last_login 
             WHERE api_service_name='Garmin'"""
@@ -185,6 +368,7 @@ def garmin_login():
         client = Garmin(email, password)
         client.login()
         log_api_event(service='Garmin', event='login')
+        persist_garmin_session(client)
         return client
     except GarminConnectAuthenticationError as e:
         log_api_event(service='Garmin', event='login failure, authentication', err=e)
@@ -228,7 +412,8 @@ def get_garmin_client(incoming_token=None):
         try:
             cl = incoming_token.get("client")
             cl.get_full_name()
-            log_api_event('Garmin', 'Token reuse: check and pass', token_age=token_age)
+            persist_garmin_session(cl)
+            count_api_event('Garmin', 'Token reuse: check and pass', token_age=token_age)
             return incoming_token
         except Exception as e:
             new_token = {"client": garmin_login(),
@@ -237,7 +422,7 @@ def get_garmin_client(incoming_token=None):
             log_api_event('Garmin', 'New Token from expired', token_age=token_age)
             return new_token
     else:
-        log_api_event('Garmin', 'Token reuse: recency skip', token_age=token_age)
+        count_api_event('Garmin', 'Token reuse: recency skip', token_age=token_age)
         return incoming_token
 
 
@@ -258,15 +443,45 @@ def test_login(service_name):
     module = importlib.import_module(module_name)
     svc_function = getattr(module, test_name)
     client = svc_function()
+    if isinstance(client, dict):
+        # get_*_client functions report a failed login as {"client": None, ...}
+        return client.get("client") is not None
     return client is not None
 
 def get_service_list(append_option=None):
     # Returns the known api services as a list
     sql="SELECT api_service_name from api_services.api_service_list"
     conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute(sql)
-    service_list = [row[0] for row in cursor.fetchall()]
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        service_list = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    finally:
+        conn.close()
     if append_option:
         service_list.append(append_option)
     return service_list
+
+
+def drop_http_connections(client):
+    # Closes the keep-alive sockets of a client's requests sessions so a forked
+    # child never shares a connection with its parent; the sessions reconnect lazily
+    for target in (client, getattr(client, "garth", None)):
+        if target is None or not hasattr(target, "__dict__"):
+            continue
+        for value in list(vars(target).values()):
+            if isinstance(value, requests.Session):
+                value.close()
+
+
+def _reset_after_fork():
+    global _cred_lock, _spotify_lock
+    _cred_lock = threading.Lock()
+    _spotify_lock = threading.RLock()
+    _spotify["refresher"] = None
+    if _spotify["client"] is not None:
+        drop_http_connections(_spotify["client"])
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
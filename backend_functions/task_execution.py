@@ -1,29 +1,47 @@
+import argparse
 import json
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import re
+import signal
+import sys
+import threading
 import time
 import importlib
-from datetime import date, datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from datetime import date, datetime, timedelta, timezone
 
+import psycopg2.errors
 import pytz
-from psycopg2.extras import execute_values
 
-from backend_functions.database_functions import sql_to_dict, qec, con_cur, get_table_row_count
-from backend_functions.helper_functions import get_sync_dates, get_last_date
-from backend_functions.logging_functions import start_timer, log_app_event, elapsed_ms
+from backend_functions.bulk_loader import timed_load, load_rates
+from backend_functions.database_functions import sql_to_dict, sql_to_list, qec, con_cur, one_sql_result, \
+    get_field_watermark
+from backend_functions.etl_pipeline import stream_extract_load, as_records, window_checkpoint
+from backend_functions.helper_functions import get_sync_dates, get_last_date, list_to_dict_by_key
+from backend_functions.log_sink import log_row, flush as flush_logs
+from backend_functions.logging_functions import start_timer, log_app_event, elapsed_ms, flush_api_events
+from backend_functions.rate_limiter import rate_limited_call
+from backend_functions.schema_updates import ensure_schema
 
 
 
 
 
 def task_executioner(force_task_name=None, force_task=False):
+    ensure_schema()
     task_sql = "SELECT * FROM tasks.vw_task_execution"
-    task_dict = sql_to_dict(query_str=task_sql)
+    task_dict = with_task_options(sql_to_dict(query_str=task_sql))
     all_task_start = start_timer()
 
-    client_dict = None
     recency_ctr = 0
     failure_ctr = 0
     timing_ctr = 0
     execution_ctr = 0
+    runnable = []
     for task in task_dict:
         ####################################
         # DETERMINE IF A RUN SHOULD BE MADE
@@ -46,6 +64,15 @@ def task_executioner(force_task_name=None, force_task=False):
             print(f"Skipping {task_name} : retired")
             continue
 
+        # Sub-hourly cadences: interval_minutes replaces the view's recency/timing rules
+        if task.get("interval_minutes") and execution_type not in ('forced', 'failures'):
+            if interval_due(task):
+                runnable.append(task)
+            else:
+                recency_ctr += 1
+                print(f"Skipping {task_name} : interval")
+            continue
+
         # Skip the too-recently-executed tasks
         if execution_type == 'recency':
             recency_ctr += 1
@@ -64,220 +91,574 @@ def task_executioner(force_task_name=None, force_task=False):
             timing_ctr += 1
             print(f"Skipping {task_name} : scheduling")
             continue
+        runnable.append(task)
+
+    ############################################################
+    # RUN THE DUE TASKS, CONCURRENTLY ACROSS LANES
+    ############################################################
+    for status in run_task_lanes(runnable):
+        if status == 'executed':
+            execution_ctr += 1
+        else:
+            failure_ctr += 1
+
+    try:
+        refresh_task_summary(changed=execution_ctr + failure_ctr > 0, force=force_task)
+    except Exception as e:
+        log_app_event(cat="Task Executioner",
+                      desc=f"Staging View Did not refresh: {e}",
+                      exec_time=elapsed_ms(all_task_start))
+
+    all_task_time = elapsed_ms(all_task_start)
+    if runnable:
+        # The scheduler ticks every minute; idle ticks are not worth a log row
+        msg = f"Attempts: E: {execution_ctr} F: {failure_ctr} || Skips: T: {timing_ctr} R: {recency_ctr}  "
+        log_app_event(cat="Task Executioner", desc=msg, exec_time=all_task_time)
+    return {"executed": execution_ctr,
+            "failed": failure_ctr,
+            "skipped_timing": timing_ctr,
+            "skipped_recency": recency_ctr,
+            "ms": all_task_time}
+
+
+def refresh_task_summary(changed=True, force=False):
+    # Refreshes the task summary matview CONCURRENTLY (readers are not blocked),
+    # at most once per TASK_SUMMARY_REFRESH_MIN_S unless forced. A debounced change
+    # stays pending and is picked up by the next call after the window.
+    # Returns 'concurrent', 'full', 'debounced' or None when nothing changed.
+    if changed:
+        _summary_refresh["pending"] = True
+    if not _summary_refresh["pending"]:
+        return None
+    last = _summary_refresh["last"]
+    if not force and last is not None and time.monotonic() - last < TASK_SUMMARY_REFRESH_MIN_S:
+        return 'debounced'
+
+    # The view summarizes logging.task_executions; make sure queued rows are in
+    flush_logs()
+    t0 = start_timer()
+    mode = 'concurrent'
+    e = qec("""REFRESH MATERIALIZED VIEW CONCURRENTLY tasks.vw_task_summary_chart_materialized""",
+            auto_commit=True)
+    if e:
+        # No usable unique index (or the view was never populated): plain refresh
+        print(f"Concurrent refresh failed, falling back: {e[0]}")
+        mode = 'full'
+        e = qec("""REFRESH MATERIALIZED VIEW tasks.vw_task_summary_chart_materialized""")
+    if e:
+        raise RuntimeError(e[0])
+
+    _summary_refresh["last"] = time.monotonic()
+    _summary_refresh["pending"] = False
+    print(f"Task summary refreshed ({mode}) in {elapsed_ms(t0)} ms")
+    return mode
+
+
+def interval_due(task, now=None):
+    # True once interval_minutes have passed since the task's last execution
+    last = task.get("last_execution_utc")
+    if last is None:
+        return True
+    if last.tzinfo is None:
+        last = last.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return now - last >= timedelta(minutes=int(task.get("interval_minutes")))
+
+
+def run_task(task, date_list=None, backfill=False):
+    # Runs a single due task end to end; returns 'executed' or 'failed'
+    # date_list overrides the windows of a Day/Range task; backfill=True leaves the
+    # watermark to the per-window checkpoints.
+    task_name = task.get('task_name')
+    ############################################################
+    # Execute the prescribed function (e.g. database cleanup)
+    ############################################################
+    if task.get("api_function") is None or task.get("api_function") == 'N/A':
+        pf_t0 = start_timer()
+        independent_logging_functions = ['playlist_sync_seeds',
+                                         'playlist_sync_one_time',
+                                         'playlist_sync_auto']
+        try:
+
+            local_function_str = task.get("python_function")
+            module_name, svc_function_name = local_function_str.rsplit('.', 1)
+            module = importlib.import_module(module_name)
+            local_function = getattr(module, svc_function_name)
+            result = local_function()
+            # A function may report stage timings for its task row as {"task_timings": {"e_time": ...}}
+            timings = (result.get("task_timings") or {}) if isinstance(result, dict) else {}
+            if svc_function_name not in independent_logging_functions:
+                task_log(task.get("task_name"),
+                         e_time=timings.get("e_time"),
+                         l_time=timings.get("l_time"),
+                         t_time=elapsed_ms(pf_t0))
+
+            update_task_through_date(task_name)
+            print(f"Logging Success fpr {task_name}")
+            return 'executed'
+        except Exception as e:
+            print(f"Logging Failure for {task_name}: {e}")
+
+            task_log(task.get("task_name"),
+                     e_time=None,
+                     l_time=None,
+                     t_time=elapsed_ms(pf_t0),
+                     fail_type='transform',
+                     fail_text=str(e))
+            return 'failed'
+
+
+    # Extract data from API
+    else:
+        extract_start = start_timer()
+        raw_api_function = task.get("api_service_function")
         ############################################################
-        # Execute the prescribed function (e.g. database cleanup)
+        # PREPARE THE EXTRACT (API client + page generator)
         ############################################################
-        if task.get("api_function") is None or task.get("api_function") == 'N/A':
-            pf_t0 = start_timer()
-            independent_logging_functions = ['playlist_sync_seeds',
-                                             'playlist_sync_one_time',
-                                             'playlist_sync_auto']
-            try:
+        try:
+            # Establish the client
+            module_name, svc_function_name = raw_api_function .rsplit('.', 1)
+            module = importlib.import_module(module_name)
+            svc_function = getattr(module, svc_function_name)
+            client_dict = lane_client(task, svc_function)
+            client = client_dict.get("client")
+            loop_type = task.get("api_loop_type")
+            api_service = task.get("api_service_name") or raw_api_function
+            print(f"DEBUG: Loop type: {loop_type}")
+
+            # If no loop type, just pull once
+            if loop_type is None or loop_type == 'N/A':
+                api_params = task.get("api_parameters")
+                curr_ts = int(datetime.now(pytz.UTC).timestamp() * 1000)
+                args = to_params(param_list=api_params,
+                                 search_val='*CURR_TS*',
+                                 replace_val=curr_ts,
+                                 return_type='dict')
+                print(f"DEBUG: args: {args}")
+                pages = json_single_page(client, task.get("api_function"), args, service=api_service)
+
+            # if the api result is paginated
+            elif loop_type == 'Next':
+                pages = json_next_pages(client, task.get("api_function"), service=api_service)
+
+            # If I need to make repeated api calls with different dates
+            else:
+                cal_col = task.get("last_calendar_field")
+                if cal_col:
+                    # index-backed MAX(), no COUNT(*) over the target table
+                    pg_schema_table, pg_field_name = cal_col.rsplit('.', 1)
+                    pg_schema_name, pg_table_name = pg_schema_table.rsplit('.', 1)
+                    wm_before = get_field_watermark(pg_schema_name, pg_table_name, pg_field_name)
 
-                local_function_str = task.get("python_function")
-                module_name, svc_function_name = local_function_str.rsplit('.', 1)
-                module = importlib.import_module(module_name)
-                local_function = getattr(module, svc_function_name)
-                local_function()
-                if svc_function_name not in independent_logging_functions:
-                    task_log(task.get("task_name"),
-                             e_time=None,
-                             l_time=None,
-                             t_time=elapsed_ms(pf_t0))
-                execution_ctr += 1
-
-                update_task_through_date(task_name)
-                print(f"Logging Success fpr {task_name}")
-            except Exception as e:
-                print(f"Logging Failure for {task_name}: {e}")
+                if date_list is None:
+                    date_list = get_sync_dates(task.get("updated_through_utc"), loop_type)
+                pages = json_date_pages(client,
+                                        task.get("api_function"),
+                                        loop_type,
+                                        date_list,
+                                        task.get("api_parameters"),
+                                        service=api_service,
+                                        checkpoint_task=task_name if backfill else None)
+            setup_time = elapsed_ms(extract_start)
+        except Exception as e:
+            extract_time = elapsed_ms(extract_start)
+            task_log(task.get("task_name"), e_time=extract_time, fail_type='extract', fail_text=str(e))
+            return 'failed'
 
-                task_log(task.get("task_name"),
-                         e_time=None,
-                         l_time=None,
-                         t_time=elapsed_ms(pf_t0),
-                         fail_type='transform',
-                         fail_text=str(e))
-                failure_ctr += 1
+        ############################################################
+        # EXTRACT FROM API & LOAD JSON TO POSTGRES (overlapped)
+        ############################################################
+        el = stream_extract_load(pages, task.get("api_function"), dedupe=bool(task.get("dedupe_payloads")),
+                                 windowed=backfill)
+        extract_time = setup_time + el["extract_ms"]
+        load_time = el["load_ms"]
+        load_stats = el["load_stats"]
+
+        if el["failed_stage"] == 'extract':
+            # Pages fetched before the failure were loaded; transform them so staging
+            # isn't left half-processed. The watermark stays put, so the next run retries.
+            t_time = None
+            fail_text = str(el["error"])
+            sproc = task.get('api_post_processing')
+            if sproc is not None and load_stats.get("rows"):
+                t_start = start_timer()
+                try:
+                    run_transform(sproc)
+                except Exception as e:
+                    fail_text = f"{fail_text}; transform of partial load failed: {e}"
+                t_time = elapsed_ms(t_start)
+            task_log(task.get("task_name"),
+                     e_time=extract_time,
+                     l_time=load_time,
+                     t_time=t_time,
+                     fail_type='extract',
+                     fail_text=fail_text,
+                     load_stats=load_stats)
+            return 'failed'
+
+        if el["failed_stage"] == 'load':
+            task_log(task.get("task_name"),
+                     e_time=extract_time,
+                     l_time=load_time,
+                     fail_type='load_time',
+                     fail_text=str(el["error"]),
+                     load_stats=load_stats)
+            return 'failed'
+        print(f"Extract: {extract_time}, Load Time: {load_time}")
 
+        ############################################################
+        # TRANSFORM DATA IN POSTGRES
+        ############################################################
 
-        # Extract data from API
+        t_start = start_timer()
+        sproc = task.get('api_post_processing')
+        rows_changed = None
+        target_table = None
+        if loop_type in ('Day', 'Range') and task.get("last_calendar_field"):
+            target_table = (pg_schema_name, pg_table_name)
+        if sproc is None:
+            t_time = elapsed_ms(t_start)
+            task_log(task.get("task_name"),
+                     e_time=extract_time,
+                     l_time=load_time,
+                     t_time=t_time,
+                     load_stats=load_stats)
         else:
-            extract_start = start_timer()
-            raw_api_function = task.get("api_service_function")
-            ############################################################
-            # EXTRACT DATA FROM API
-            ############################################################
             try:
-                # Establish the client
-                module_name, svc_function_name = raw_api_function .rsplit('.', 1)
-                module = importlib.import_module(module_name)
-                svc_function = getattr(module, svc_function_name)
-                client_dict = svc_function(client_dict)
-                client = client_dict.get("client")
-                loop_type = task.get("api_loop_type")
-                print(f"DEBUG: Loop type: {loop_type}")
-
-                # If no loop type, just pull once
-                if loop_type is None or loop_type == 'N/A':
-                    api_params = task.get("api_parameters")
-                    curr_ts = int(datetime.now(pytz.UTC).timestamp() * 1000)
-                    args = to_params(param_list=api_params,
-                                     search_val='*CURR_TS*',
-                                     replace_val=curr_ts,
-                                     return_type='dict')
-                    print(f"DEBUG: args: {args}")
-                    if args:
-                        json_data = getattr(client, task.get("api_function"))(**args)
-                    else:
-                        json_data = getattr(client, task.get("api_function"))()
-
-                # if the api result is paginated
-                elif loop_type == 'Next':
-                    json_data = json_next_loop(client, task.get("api_function"))
-
-                # If I need to make repeated api calls with different dates
-                else:
-                    cal_col = task.get("last_calendar_field")
-                    if cal_col:
-                        pg_schema_table, pg_field_name = cal_col.rsplit('.', 1)
-                        pg_schema_name, pg_table_name = pg_schema_table.rsplit('.', 1)
-                        rc_before = get_table_row_count(pg_schema_name, pg_table_name)
-                    else:
-                        rc_before = 0
-
-                    date_list = get_sync_dates(task.get("updated_through_utc"), loop_type)
-                    json_data = json_date_loop(client,
-                                               task.get("api_function"),
-                                               loop_type,
-                                               date_list,
-                                               task.get("api_parameters"))
-                extract_time = elapsed_ms(extract_start)
-            except Exception as e:
-                extract_time = elapsed_ms(extract_start)
-                task_log(task.get("task_name"), e_time=extract_time, fail_type='extract', fail_text=str(e))
-                failure_ctr += 1
-                continue
-            print(f"Extract: {extract_time}")
-            # load the data to postgres
-
-            ############################################################
-            # LOAD JSON TO POSTGRES
-            ############################################################
-            load_start = start_timer()
-            try:
-                json_loading(json_data, task.get("api_function"))
-                load_time = elapsed_ms(load_start)
+                rows_changed = run_transform(sproc, target_table)
+                t_time = elapsed_ms(t_start)
+                task_log(task.get("task_name"),
+                     e_time=extract_time,
+                     l_time=load_time,
+                     t_time=t_time,
+                     load_stats=load_stats)
             except Exception as e:
-                load_time = elapsed_ms(load_start)
+                t_time = elapsed_ms(t_start)
                 task_log(task.get("task_name"),
                          e_time=extract_time,
                          l_time=load_time,
-                         fail_type='load_time', fail_text=str(e))
-                failure_ctr += 1
-                continue
-            print(f"Extract: {extract_time}, Load Time: {load_time}")
+                         t_time=t_time,
+                         fail_type='transform',
+                         fail_text=str(e),
+                         load_stats=load_stats)
+                return 'failed'
 
-            ############################################################
-            # TRANSFORM DATA IN POSTGRES
-            ############################################################
+        print(f"Extract: {extract_time}, Load Time: {load_time}, Transform: {t_time}")
 
-            t_start = start_timer()
-            sproc = task.get('api_post_processing')
-            if sproc is None:
-                t_time = elapsed_ms(t_start)
-                task_log(task.get("task_name"),
-                         e_time=extract_time,
-                         l_time=load_time,
-                         t_time=t_time)
-                execution_ctr += 1
-            else:
-                try:
-                    call_sql = f"CALL staging.{sproc}();"
-                    qec(call_sql, auto_commit=True)
-                    t_time = elapsed_ms(t_start)
-                    task_log(task.get("task_name"),
-                         e_time=extract_time,
-                         l_time=load_time,
-                         t_time=t_time)
-                    execution_ctr += 1
-                except Exception as e:
-                    t_time = elapsed_ms(t_start)
-                    task_log(task.get("task_name"),
-                             e_time=extract_time,
-                             l_time=load_time,
-                             t_time=t_time,
-                             fail_type='transform',
-                             fail_text=str(e))
-                    failure_ctr += 1
-                    continue
-
-            print(f"Extract: {extract_time}, Load Time: {load_time}, Transform: {t_time}")
-
-            #############################################################
-            # UPDATE CALENDAR DATE
-            ############################################################
-            if loop_type in ('Day', 'Range'):
-                cal_col = task.get("last_calendar_field")
-                if cal_col:
-                    print(f"Sending Updated value to task.config")
-                    print(f"Range Used: {date_list}")
-                    pg_schema_table, pg_field_name = cal_col.rsplit('.', 1)
-                    pg_schema_name, pg_table_name = pg_schema_table.rsplit('.', 1)
-                    rc_after = get_table_row_count(pg_schema_name, pg_table_name)
-                    if rc_after > rc_before:
-                        print(f"Row Delta {rc_after-rc_before} : {rc_before}-->{rc_after}")
-                        update_sql = f"""UPDATE tasks.task_config
-                                    SET updated_through_date = (SELECT MAX({pg_field_name}) FROM {pg_schema_table}) 
-                                    WHERE task_name = '{task_name}';"""
-                        qec(update_sql)
-                        print(update_sql)
-                    else:
-                        print(f"Row Delta {rc_after - rc_before} : {rc_before}-->{rc_after}")
-                        through_date = get_last_date(date_list)
-                        update_sql = f"""UPDATE tasks.task_config 
-                                    SET updated_through_date = %s::DATE 
-                                    WHERE task_name = %s"""
-                        params = (through_date, task_name)
-                        qec(update_sql, params)
-                    print("Update Complete")
-            else:
-                # non-range task, update task with today
-                update_task_through_date(task_name)
+        #############################################################
+        # UPDATE CALENDAR DATE
+        ############################################################
+        if backfill:
+            # windows were checkpointed as they loaded
+            pass
+        elif loop_type in ('Day', 'Range'):
+            cal_col = task.get("last_calendar_field")
+            if cal_col:
+                print(f"Sending Updated value to task.config")
+                print(f"Range Used: {date_list}")
+                wm_after = get_field_watermark(pg_schema_name, pg_table_name, pg_field_name)
+                if rows_changed is None:
+                    # transform could not report its row count; fall back to watermark movement
+                    moved = wm_after is not None and (wm_before is None or wm_after > wm_before)
+                    rows_changed = 1 if moved else 0
+                if rows_changed > 0:
+                    print(f"Row Delta {rows_changed} : watermark {wm_before}-->{wm_after}")
+                    update_sql = """UPDATE tasks.task_config
+                                SET updated_through_date = %s::DATE
+                                WHERE task_name = %s;"""
+                    qec(update_sql, (wm_after, task_name))
+                else:
+                    print(f"Row Delta 0 : watermark {wm_before}-->{wm_after}")
+                    through_date = get_last_date(date_list)
+                    update_sql = f"""UPDATE tasks.task_config 
+                                SET updated_through_date = %s::DATE 
+                                WHERE task_name = %s"""
+                    params = (through_date, task_name)
+                    qec(update_sql, params)
+                print("Update Complete")
+        else:
+            # non-range task, update task with today
+            update_task_through_date(task_name)
+    return 'executed'
+
+
+def proc_commits(sproc):
+    # True when staging.<sproc> COMMITs / ROLLBACKs itself and so can't run inside a
+    # transaction. Read from the procedure's source before its first call (memoized),
+    # so a committing procedure is never run twice to find out.
+    if sproc not in _proc_commits:
+        src = one_sql_result(f"""SELECT string_agg(p.prosrc, ' ') FROM pg_catalog.pg_proc p
+                                 JOIN pg_catalog.pg_namespace n ON n.oid = p.pronamespace
+                                 WHERE n.nspname = 'staging' AND p.proname = '{sproc}'""")
+        # Comments are stripped so a commented-out COMMIT doesn't count
+        src = re.sub(r"--[^\n]*|/\*.*?\*/", " ", src or "", flags=re.S)
+        _proc_commits[sproc] = re.search(r"\b(COMMIT|ROLLBACK)\b", src, re.I) is not None
+    return _proc_commits[sproc]
+
+
+def run_transform(sproc, target_table=None):
+    # Calls staging.<sproc>() and returns the net rows it added to target_table
+    # (schema, table): inserts minus deletes from pg_stat_xact_user_tables inside the
+    # same transaction, which is what a before/after COUNT(*) measured. Upserted
+    # updates of existing rows don't count. Procedures that manage their own
+    # transactions run in autocommit and return None.
+    call_sql = f"CALL staging.{sproc}();"
+    if target_table is not None and not proc_commits(sproc):
+        conn, cur = con_cur()
+        try:
+            cur.execute(call_sql)
+            cur.execute("""SELECT n_tup_ins - n_tup_del FROM pg_stat_xact_user_tables
+                            WHERE schemaname = %s AND relname = %s""", target_table)
+            row = cur.fetchone()
+            conn.commit()
+            cur.close()
+            return row[0] if row else 0
+        except psycopg2.errors.InvalidTransactionTermination:
+            # Commits from a nested procedure the source check can't see
+            conn.rollback()
+            _proc_commits[sproc] = True
+        finally:
+            conn.close()
+
+    e = qec(call_sql, auto_commit=True)
+    if e:
+        raise RuntimeError(e[0])
+    return None
+
+
+TASK_LANE_DEFAULT_LIMIT = int(os.getenv("TASK_LANE_DEFAULT_LIMIT", 1))
+TASK_SUMMARY_REFRESH_MIN_S = int(os.getenv("TASK_SUMMARY_REFRESH_MIN_S", 300))
+_summary_refresh = {"last": None, "pending": False}
+
+TASK_OPTION_COLUMNS = ['execution_lane', 'dedupe_payloads', 'interval_minutes', 'timeout_s']
+
+# Tasks run in-process, sharing the rate limiters, lane clients and credential
+# caches. Only tasks with task_config.timeout_s > 0 run in a separate worker under
+# that wall-clock budget. Workers come from a forkserver rather than a plain fork:
+# the scheduler has lane, log-sink and health threads, and a fork taken while one
+# of them holds a lock (logging, the connection pool, the SSL layer) can deadlock
+# the child. A worker starts with empty caches (it logs in from the stored
+# sessions) and whatever it learns is lost when it exits.
+TASK_KILL_GRACE_S = int(os.getenv("TASK_KILL_GRACE_S", 10))
+
+_task_ctx = multiprocessing.get_context("forkserver")
+_task_ctx.set_forkserver_preload(["backend_functions.task_execution"])
+
+_proc_commits = {}
+_lane_clients = {}
+_lane_client_locks = {}
+_lane_lock = threading.Lock()
+
+
+def with_task_options(task_list):
+    # tasks.vw_task_execution predates the newer task_config columns, so read them directly
+    cols = ", ".join(TASK_OPTION_COLUMNS)
     try:
-        if execution_ctr + failure_ctr > 0:
-            sql = """REFRESH MATERIALIZED VIEW tasks.vw_task_summary_chart_materialized"""
-            qec(sql)
+        options = list_to_dict_by_key(sql_to_dict(f"SELECT task_name, {cols} FROM tasks.task_config"),
+                                      'task_name')
     except Exception as e:
-        log_app_event(cat="Task Executioner",
-                      desc=f"Staging View Did not refresh: {e}",
-                      exec_time=elapsed_ms(all_task_start))
+        print(f"Task options unavailable: {e}")
+        options = {}
+
+    for task in task_list:
+        for col, val in options.get(task.get("task_name"), {}).items():
+            task.setdefault(col, val)
+    return task_list
+
+
+def lane_limits():
+    # TASK_LANE_LIMITS="Garmin=1,Spotify=2,python_function=1"
+    limits = {}
+    raw = os.getenv("TASK_LANE_LIMITS", "")
+    for item in raw.split(','):
+        if '=' in item:
+            lane, limit = item.split('=', 1)
+            limits[lane.strip()] = max(1, int(limit))
+    return limits
+
+
+def task_lane(task):
+    # Tasks in the same lane share a concurrency cap; api tasks are grouped by service
+    if task.get("execution_lane"):
+        return task.get("execution_lane")
+    if task.get("api_function") is None or task.get("api_function") == 'N/A':
+        return 'python_function'
+    return task.get("api_service_name") or task.get("api_service_function")
+
+
+def lane_client(task, svc_function):
+    # One client per lane, refreshed under a lock so concurrent tasks don't log in twice
+    lane = task_lane(task)
+    with _lane_lock:
+        lock = _lane_client_locks.setdefault(lane, threading.Lock())
+    with lock:
+        client_dict = svc_function(_lane_clients.get(lane))
+        _lane_clients[lane] = client_dict
+    return client_dict
+
+
+def run_task_lanes(task_list):
+    # Runs tasks concurrently across lanes; each lane keeps view order and its own cap.
+    # Returns one status per task.
+    if any(task_timeout_s(task) > 0 for task in task_list):
+        # Start the server (and its module preload) once, before any lane thread exists
+        multiprocessing.forkserver.ensure_running()
+    if len(task_list) <= 1:
+        return [run_task_isolated(task) for task in task_list]
+
+    lanes = {}
+    for task in task_list:
+        lanes.setdefault(task_lane(task), deque()).append(task)
+
+    limits = lane_limits()
+    statuses = []
+
+    def drain_lane(lane_name, lane_tasks):
+        while True:
+            try:
+                task = lane_tasks.popleft()
+            except IndexError:
+                return
+            try:
+                statuses.append(run_task_isolated(task))
+            except Exception as e:
+                print(f"Unhandled failure in {task.get('task_name')} ({lane_name}): {e}")
+                statuses.append('failed')
+
+    workers = []
+    for lane_name, lane_tasks in lanes.items():
+        slots = min(limits.get(lane_name, TASK_LANE_DEFAULT_LIMIT), len(lane_tasks))
+        workers.extend([(lane_name, lane_tasks)] * slots)
+
+    print(f"Running {len(task_list)} task(s) across {len(lanes)} lane(s) on {len(workers)} worker(s)")
+    with ThreadPoolExecutor(max_workers=len(workers), thread_name_prefix="task-lane") as pool:
+        futures = [pool.submit(drain_lane, lane_name, lane_tasks) for lane_name, lane_tasks in workers]
+        for future in futures:
+            future.result()
+    return statuses
 
-    all_task_time = elapsed_ms(all_task_start)
-    msg = f"Attempts: E: {execution_ctr} F: {failure_ctr} || Skips: T: {timing_ctr} R: {recency_ctr}  "
-    log_app_event(cat="Task Executioner", desc=msg, exec_time=all_task_time)
-    return
 
+def task_timeout_s(task):
+    return int(task.get("timeout_s") or 0)
 
-def task_log(task_name=None, e_time=None, l_time=None, t_time=None, fail_type=None, fail_text=None):
-    insert_sql = """INSERT INTO logging.task_executions (
-                              task_name,
-                              extract_time_ms,
-                              load_time_ms,
-                              transform_time_ms,
-                              failure_type,
-                              error_text) VALUES (
-     %s, %s, %s, %s, %s, %s)"""
-    params = (task_name, e_time, l_time, t_time, fail_type, fail_text)
-    qec(insert_sql, params)
+
+def _task_child(task, send_conn):
+    # Body of the task worker: run the task, flush its log rows, report the status
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    status = 'failed'
+    try:
+        status = run_task(task)
+    except Exception as e:
+        task_log(task_name=task.get("task_name"), fail_type='unhandled', fail_text=str(e))
+    finally:
+        # multiprocessing children skip atexit handlers
+        flush_api_events()
+        flush_logs()
+        send_conn.send(status)
+        send_conn.close()
+
+
+def run_task_isolated(task):
+    # Runs the task in-process unless it has a timeout_s; then in a forkserver child
+    # with that wall-clock budget. A child that overruns is terminated (then killed)
+    # and logged with failure_type 'timeout'
+    timeout_s = task_timeout_s(task)
+    if timeout_s <= 0:
+        return run_task(task)
+
+    task_name = task.get("task_name")
+    recv_conn, send_conn = _task_ctx.Pipe(duplex=False)
+    # The task row is pickled to the child; RealDictRow becomes a plain dict
+    proc = _task_ctx.Process(target=_task_child, args=(dict(task), send_conn), name=f"task-{task_name}",
+                             daemon=True)
+    t0 = start_timer()
+    proc.start()
+    send_conn.close()
+    proc.join(timeout_s)
+
+    if proc.is_alive():
+        proc.terminate()
+        proc.join(TASK_KILL_GRACE_S)
+        how = 'terminated'
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+            how = 'killed'
+        recv_conn.close()
+        print(f"{task_name} exceeded {timeout_s}s and was {how}")
+        task_log(task_name=task_name, fail_type='timeout',
+                 fail_text=f"Exceeded {timeout_s}s wall-clock budget; worker {how}")
+        log_app_event(cat='Task Timeout', desc=task_name, exec_time=elapsed_ms(t0))
+        return 'failed'
+
+    status = recv_conn.recv() if recv_conn.poll() else None
+    recv_conn.close()
+    if status is None:
+        task_log(task_name=task_name, fail_type='crash', fail_text=f"Worker exited with code {proc.exitcode}")
+        return 'failed'
+    return status
+
+
+def _reset_after_fork():
+    # Forked task workers get fresh lane locks and their own HTTP connections
+    global _lane_lock
+    _lane_lock = threading.Lock()
+    _lane_client_locks.clear()
+    service_logins = sys.modules.get("backend_functions.service_logins")
+    if service_logins is not None:
+        for client_dict in _lane_clients.values():
+            if isinstance(client_dict, dict) and client_dict.get("client") is not None:
+                service_logins.drop_http_connections(client_dict["client"])
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def task_log(task_name=None, e_time=None, l_time=None, t_time=None, fail_type=None, fail_text=None,
+             load_stats=None, task_detail=None):
+    load_stats = load_stats or {}
+    columns = ("task_name",
+               "extract_time_ms",
+               "load_time_ms",
+               "transform_time_ms",
+               "failure_type",
+               "error_text",
+               "rows_loaded",
+               "bytes_loaded",
+               "load_rows_per_s",
+               "load_bytes_per_s",
+               "duplicates_skipped",
+               "task_detail")
+    params = (task_name, e_time, l_time, t_time, fail_type, fail_text,
+              load_stats.get("rows"),
+              load_stats.get("bytes"),
+              load_stats.get("rows_per_s"),
+              load_stats.get("bytes_per_s"),
+              load_stats.get("duplicates"),
+              task_detail)
+    log_row("logging.task_executions", columns, params)
     return
 
 
-def json_next_loop(client, function, api_parameters=None):
+def json_single_page(client, function, args=None, service=None):
+    # Single API call, as a one-page generator
+    service = service or function
+    if args:
+        raw_json = rate_limited_call(service, getattr(client, function), **args)
+    else:
+        raw_json = rate_limited_call(service, getattr(client, function))
+
+    records = as_records(raw_json)
+    if records:
+        yield records
+
+
+def json_next_pages(client, function, api_parameters=None, service=None):
+    # Yields each page of a paginated API result as a list of records
     print("DEBUG: INSIDE NEXT LOOP")
-    all_json = []
-    # Fetch & loop through API results
-    offset = 0
-    limit = 50
+    # Calls are paced by the shared per-service rate limiter
+    service = service or function
     if api_parameters:
         param_list = [param.strip() for param in api_parameters.split(',')]
 
@@ -287,27 +668,20 @@ def json_next_loop(client, function, api_parameters=None):
             args.append(param)
 
     while True:
-        # Ensure we're being good API Citizens
-        if offset != 0:
-            time.sleep(1)
-
         if api_parameters:
-            raw_json = getattr(client, function)(*args)
+            raw_json = rate_limited_call(service, getattr(client, function), *args)
         else:
-            raw_json = getattr(client, function)()
+            raw_json = rate_limited_call(service, getattr(client, function))
 
         if  raw_json is None:
             raw_json = {}
 
         print('Next loop DEBUG raw JSON')
         print(raw_json)
-        # Append the results
-        if isinstance(raw_json, dict):
-            all_json.append(raw_json)
-        elif isinstance(raw_json, list):
-            all_json.extend(raw_json)
-        elif raw_json is not None:
+        records = as_records(raw_json)
+        if records is None:
             break
+        yield records
 
         # Break the loop as necessary
         try:
@@ -317,16 +691,17 @@ def json_next_loop(client, function, api_parameters=None):
             break
 
 
-    return all_json
-
+def json_next_loop(client, function, api_parameters=None, service=None):
+    return list(chain.from_iterable(json_next_pages(client, function, api_parameters, service)))
 
-def json_date_loop(client, function, loop_type, date_list, api_parameters=None):
 
-    all_json = []
+def json_date_pages(client, function, loop_type, date_list, api_parameters=None, service=None,
+                    checkpoint_task=None):
+    # Yields the API result for each date (or date range) as a list of records
+    # Calls are paced by the shared per-service rate limiter
+    # With checkpoint_task, a window_checkpoint marker follows each completed window
+    service = service or function
     for date_val in date_list:
-        # pause for 2 seconds during each loop
-        if date_val != date_list[0]:
-            time.sleep(2)
 
         # If I can pull a range of values, the result will be a tuple.
         if loop_type == 'Range':
@@ -340,8 +715,8 @@ def json_date_loop(client, function, loop_type, date_list, api_parameters=None):
             d2 = None
 
         # Build the arguments list
-        param_list = [param.strip() for param in api_parameters.split(',')]
         if api_parameters:
+            param_list = [param.strip() for param in api_parameters.split(',')]
             # Replace placeholders with actual date values
             args = []
             for param in param_list:
@@ -353,66 +728,53 @@ def json_date_loop(client, function, loop_type, date_list, api_parameters=None):
                     # Keep other parameters as-is
                     args.append(param)
             print(args)
-            raw_json = getattr(client, function)(*args)
+            raw_json = rate_limited_call(service, getattr(client, function), *args)
         else:
             # Fallback to original behavior if no api_parameters specified
             if loop_type == 'date_range':
-                raw_json = getattr(client, function)(d1, d2)
+                raw_json = rate_limited_call(service, getattr(client, function), d1, d2)
             else:
-                raw_json = getattr(client, function)(date_val)
-
-        # Append the results
-        if isinstance(raw_json, dict):
-            all_json.append(raw_json)
-        elif isinstance(raw_json, list):
-            all_json.extend(raw_json)
-        elif raw_json is not None:
+                raw_json = rate_limited_call(service, getattr(client, function), date_val)
+
+        records = as_records(raw_json)
+        if records is None:
             break
+        yield records
+
+        if checkpoint_task:
+            yield window_checkpoint(checkpoint_task, d1, d2 or d1)
 
-    return all_json
 
+def json_date_loop(client, function, loop_type, date_list, api_parameters=None, service=None):
+    return list(chain.from_iterable(json_date_pages(client, function, loop_type, date_list, api_parameters,
+                                                    service)))
 
-def json_loading(json_data, function_name):
+
+def json_loading(json_data, function_name, dedupe=False):
+    # Loads API payloads into staging.api_imports and returns the load statistics
+    # (rows, bytes, duplicates, rows_per_s, bytes_per_s) for task_log.
+    # dedupe=True skips payloads already loaded for this function_name.
 
     if isinstance(json_data, dict):
         json_data = [json_data]
 
     if not json_data:
         print("No data to load.")
-        return
-
-    # --- Step 2: Establish DB connection ---
-    conn, cur = con_cur()  # assumes you have your con_cur() returning (conn, cur)
-
-    # --- Step 3: Prepare data for insertion ---
-    values = [(function_name, json.dumps(record)) for record in json_data]
-
-    # --- Step 4: Choose optimized insert strategy ---
-    if len(values) == 1:
-        # Single insert - minimal overhead
-        cur.execute(
-            """
-            INSERT INTO staging.api_imports (api_function_name, payload)
-            VALUES (%s, %s);
-            """,
-            values[0],
-        )
-    else:
-        # Bulk insert - efficient for many records
-        execute_values(
-            cur,
-            """
-            INSERT INTO staging.api_imports (api_function_name, payload)
-            VALUES %s;
-            """,
-            values,
-            page_size=1000,  # can tune based on memory/network
-        )
-
-    conn.commit()
-    cur.close()
-    conn.close()
-    return
+        return load_rates({"rows": 0, "bytes": 0, "duplicates": 0, "method": None}, 0)
+
+    conn, cur = con_cur()  # pooled connection, close() returns it to the pool
+    try:
+        # COPY for big batches, execute_values for tiny ones
+        load_stats = timed_load(cur, json_data, function_name, dedupe)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+    print(f"Loaded {load_stats['rows']} rows via {load_stats['method']} "
+          f"({load_stats['rows_per_s']} rows/s, {load_stats['bytes_per_s']} bytes/s), "
+          f"{load_stats['duplicates']} duplicate(s) skipped")
+    return load_stats
 
 
 def reset_and_reload():
@@ -439,6 +801,9 @@ def reset_and_reload():
 
     stg_list = sql_to_dict(stg_sql)
 
+    # Backfill progress refers to staging rows that are about to be truncated
+    qec("TRUNCATE tasks.task_checkpoints;")
+
     for stg in stg_list:
         stg_table = stg.get("table_name")
         print(f"Deleting from: {stg_table}")
@@ -446,6 +811,72 @@ def reset_and_reload():
         qec(del_sql)
 
 
+def run_backfill(task_name, since=None, until=None, batch_windows=21, resume=True):
+    # Long-running historical load for a Day/Range task (e.g. since 2020-01-01 after reset_and_reload).
+    # Windows are loaded in batches of batch_windows; each window's payloads, checkpoint and
+    # watermark commit in one transaction, and each batch is transformed before the next starts.
+    # Only backfills write tasks.task_checkpoints. Re-running with the same arguments skips
+    # the windows already checkpointed, so it resumes at the first gap after `since`.
+    #   python -m backend_functions.task_execution --backfill TASK --since 2020-01-01 [--until YYYY-MM-DD]
+    ensure_schema()
+    task_list = sql_to_dict(f"SELECT * FROM tasks.vw_task_execution WHERE task_name = '{task_name}'")
+    if not task_list:
+        print(f"Backfill aborted, unknown task: {task_name}")
+        return False
+    task = with_task_options(task_list)[0]
+    loop_type = task.get("api_loop_type")
+    if loop_type not in ('Day', 'Range'):
+        print(f"Backfill aborted, {task_name} is not date-looped ({loop_type})")
+        return False
+
+    start = since or task.get("updated_through_utc")
+    windows = get_sync_dates(start, loop_type, limit=False)
+    if until:
+        # Range windows are cut at until as well, not just filtered by their start
+        until = str(until)
+        windows = [(w[0], min(w[1], until)) if isinstance(w, tuple) else w
+                   for w in windows if (w[0] if isinstance(w, tuple) else w) <= until]
+
+    if resume and windows:
+        first = windows[0][0] if isinstance(windows[0], tuple) else windows[0]
+        done_sql = f"""SELECT window_start FROM tasks.task_checkpoints
+                        WHERE task_name = '{task_name}' AND window_start >= '{first}'::DATE"""
+        checkpointed = {d.strftime('%Y-%m-%d') for d in sql_to_list(done_sql)}
+        remaining = [w for w in windows if (w[0] if isinstance(w, tuple) else w) not in checkpointed]
+        if len(remaining) < len(windows):
+            resume_at = remaining[0] if remaining else None
+            print(f"Resuming {task_name}: {len(windows) - len(remaining)} window(s) already checkpointed, "
+                  f"first gap {resume_at}")
+        windows = remaining
+
+    if not windows:
+        print(f"Backfill of {task_name}: nothing to do")
+        return True
+
+    t0 = start_timer()
+    total = len(windows)
+    done = 0
+    for i in range(0, total, batch_windows):
+        batch = windows[i:i + batch_windows]
+        status = run_task(task, date_list=batch, backfill=True)
+        if status != 'executed':
+            log_app_event(cat="Backfill",
+                          desc=f"{task_name} stopped at window {done}/{total} ({batch[0]})",
+                          err="Batch failed, rerun to resume from the last checkpoint",
+                          exec_time=elapsed_ms(t0))
+            return False
+
+        done += len(batch)
+        elapsed_s = elapsed_ms(t0) / 1000
+        eta_s = elapsed_s / done * (total - done)
+        msg = (f"{task_name}: {done}/{total} windows through {get_last_date(batch)} "
+               f"| {elapsed_s:.0f}s elapsed, ~{eta_s:.0f}s left")
+        print(msg)
+        log_app_event(cat="Backfill", desc=msg, exec_time=elapsed_ms(t0))
+
+    return True
+
+
 def update_task_through_date(task_name):
     today = date.today()
     update_sql = f"""UPDATE tasks.task_config
@@ -480,3 +911,18 @@ def default_range():
     d2 = date.today()
     d1 = d2 - timedelta(days=1)
     return d1, d2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PiFitness task backfill")
+    parser.add_argument("--backfill", metavar="TASK", required=True, help="task_name of a Day/Range task")
+    parser.add_argument("--since", default=None, help="first date (YYYY-MM-DD); default the task's watermark")
+    parser.add_argument("--until", default=None, help="last date (YYYY-MM-DD); default today")
+    parser.add_argument("--batch-windows", type=int, default=21, help="windows loaded per transform")
+    parser.add_argument("--no-resume", action="store_true", help="reload windows already checkpointed")
+    args = parser.parse_args()
+
+    ok = run_backfill(args.backfill, since=args.since, until=args.until,
+                      batch_windows=args.batch_windows, resume=not args.no_resume)
+    flush_logs()
+    sys.exit(0 if ok else 1)
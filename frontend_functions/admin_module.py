@@ -11,7 +11,7 @@ from backend_functions.database_functions import get_conn, qec, sql_to_dict, get
 from backend_functions.helper_functions import reverse_key_lookup, list_to_dict_by_key, set_keys_to_none, \
     add_time_ago_column, col_value
 from backend_functions.logging_functions import log_app_event, start_timer, elapsed_ms
-from backend_functions.service_logins import test_login, get_service_list
+from backend_functions.service_logins import test_login, get_service_list, invalidate_credentials
 from backend_functions.task_execution import task_executioner
 from backend_functions.viz_factory.db_size import render_db_size_dashboard
 from backend_functions.viz_factory.task_summary import render_task_summary_dashboard
@@ -132,6 +132,7 @@ def render_password_submodule():
                         DO UPDATE SET api_credentials = EXCLUDED.api_credentials;"""
             params = (ss.selected_service, enc_input)
             qec(insert_sql, params)
+            invalidate_credentials(ss.selected_service)
             log_app_event(cat='Admin', desc=f"Credential Saved: {ss.selected_service}", exec_time=elapsed_ms(t0))
             if test_login(ss.selected_service):
                 st.balloons()
@@ -143,9 +144,10 @@ def render_password_submodule():
                 st.rerun()
             else:
                 st.error('Unable to establish connection with those credentials')
-                delete_sql = f"""DELETE FROM api_services.credentials WHERE api_service_name = ?"""
+                delete_sql = """DELETE FROM api_services.credentials WHERE api_service_name = %s"""
                 params = (ss.selected_service, )
                 qec(delete_sql, params)
+                invalidate_credentials(ss.selected_service)
                 ss.user_inputs = None
                 ss.credential_test_proceed = None
                 time.sleep(1)
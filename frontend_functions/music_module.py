@@ -8,8 +8,9 @@ from streamlit import session_state as ss
 
 from backend_functions.database_functions import get_conn, qec, sql_to_list
 from backend_functions.file_handlers import album_art_path
-from backend_functions.music_functions import playlist_reset, playlist_upload, get_now_playing, add_isrc_to_local, \
+from backend_functions.music_functions import get_now_playing, add_isrc_to_local, \
     record_recommendation_decision, remove_recommendation, add_into_current_ratings, save_matchup_results
+from backend_functions.playlist_sync import sync_playlist
 from backend_functions.service_logins import get_spotify_client
 from backend_functions.task_execution import task_executioner
 from frontend_functions.music_widgets import playlist_config_table, render_shuffle_df
@@ -138,11 +139,9 @@ def render_playlist_shuffle():
     if st.button(':material/cloud_upload: Send to Spotify'):
         track_list = df['track_id'].to_list()
         target_list_id = df['target_playlist_id'].iloc[0]
-        client = playlist_reset(client=None,
-                                list_id=target_list_id)
-        client = playlist_upload(client=client,
-                                 list_id=target_list_id,
-                                 track_list=track_list)
+        client, _summary = sync_playlist(client=None,
+                                         list_id=target_list_id,
+                                         track_list=track_list)
 
         update_sql = f"""UPDATE music.playlist_config SET
                         ratings_weight = {rtw},
@@ -152,6 +151,7 @@ def render_playlist_shuffle():
                         WHERE playlist_id = '{id}';"""
         qec(update_sql)
         pop_list = ['shuffle_df',
+                    'shuffle_seed',
                     'pl_selection',
                     'pc_df']
         ss_pop(pop_list)
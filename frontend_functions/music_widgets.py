@@ -7,6 +7,7 @@ from streamlit import session_state as ss
 
 from backend_functions.database_functions import get_conn, qec
 from backend_functions.helper_functions import convert_to_json_serializable
+from backend_functions.shuffle_engine import new_seed, shuffle_order, shuffle_weights
 from frontend_functions.streamlit_helpers import sync_df_from_data_editor
 
 
@@ -143,16 +144,18 @@ def render_shuffle_df(rcw, rtw, rnw, mts):
         'track_id': None,
         'target_playlist_id': None}
 
-    # Update Dataframe order
-    df['play_score'] = ((df['ratings_pct'] * rtw) +
-                            (df['recency_pct'] * rcw) +
-                            (df['random_pct'] * (rnw / 10)))
-
-    df = df.sort_values(by="play_score", ascending=False).reset_index(drop=True)
-
-    if mts != 9999:
-            df['running_sum_min'] = (df['duration_s'].cumsum()) / 60
-            df = df[df['running_sum_min'] <= mts].copy()
+    # Update Dataframe order: weighted sample, reproducible for the page's seed
+    if "shuffle_seed" not in ss:
+        ss.shuffle_seed = new_seed()
+    weights = shuffle_weights(df['ratings_pct'].to_numpy(), df['recency_pct'].to_numpy(), rtw, rcw, rnw)
+    order = shuffle_order(weights,
+                          durations_s=df['duration_s'].to_numpy(),
+                          budget_minutes=mts,
+                          artists=df['artist_id'].to_numpy() if 'artist_id' in df.columns else None,
+                          albums=df['album_id'].to_numpy() if 'album_id' in df.columns else None,
+                          seed=ss.shuffle_seed)
+    df['play_score'] = weights
+    df = df.iloc[order].reset_index(drop=True)
 
     st.dataframe(data=df,
                  column_order=cols,